@@ -1,55 +1,49 @@
-import pandas as pd
-import plotly.express as px
-import pydeck as pdk
 import streamlit as st
-import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
 
-from config import (calcula_data, hist_handler, load_data,
-                    preventiva_historico, ultima_atualizacao)
+from bootstrap import barra_lateral, iniciar
+from cache import versioned
+from ui import painel
 
-st.set_page_config(page_title="Gestão de Frotas",
-                   page_icon="🛠",
-                   layout='wide')
+RANGES = [
+    'Lista de Equipamentos!A:AY',
+    'HISTORICO_DATA!A:Y',
+    'PREVENTIVAS_MENSAL_PLT!A:E',
+    'Coordenadas!A:C',
+]
 
-with open('./config.yaml') as file:
-    configuration = yaml.load(file, Loader=SafeLoader)
+authenticator = iniciar()
 
-authenticator = stauth.Authenticate(
-    configuration['credentials'],
-    configuration['cookie']['name'],
-    configuration['cookie']['key'],
-    configuration['cookie']['expiry_days'],
-    configuration['pre-authorized']
-)
 
-
-@st.cache_data(ttl=600, show_spinner=False)
-def mapa_cidades(cliente_filtro, classe_filtro):
+@versioned()
+def cubo_mapa():
+    '''
+        Active machines counted by city, client and class, with the city
+        coordinates. Client and class are categoricals, so every filter
+        combination is answered from this one cached table.
+    '''
     df_equip = load_data('Lista de Equipamentos!A:AY')
-    df_equip = df_equip.loc[df_equip['Status'] == 'ATIVO']
-    df_equip['LOCALIZAÇÃO'] = df_equip['LOCALIZAÇÃO'].str.strip()
-    df_equip['Cidade'] = df_equip['Cidade'].str.strip()
-    df_equip['Cidade'] = df_equip['Cidade'].str.lower()
-    df_equip = df_equip[['Cidade', 'LOCALIZAÇÃO', 'Classe']]
+    df_equip = df_equip.loc[df_equip['Status'] == 'ATIVO', ['Cidade', 'LOCALIZAÇÃO', 'Classe']]
+    df_equip = pd.DataFrame({'Cidade': df_equip['Cidade'].str.strip().str.lower(),
+                             'LOCALIZAÇÃO': df_equip['LOCALIZAÇÃO'].str.strip(),
+                             'Classe': df_equip['Classe'].str.strip()})
+
+    cubo = df_equip.groupby(['Cidade', 'LOCALIZAÇÃO', 'Classe'], observed=True).size()
+    cubo = cubo.reset_index(name='QUANTIDADE')
 
-    df_coord = load_data('Coordenadas!A:C')
-    df_coord['Latitude'] = df_coord['Latitude'].str.replace(',', '.')
-    df_coord['Longitude'] = df_coord['Longitude'].str.replace(',', '.')
-    df_coord['Latitude'] = pd.to_numeric(df_coord['Latitude'], errors='coerce')
-    df_coord['Longitude'] = pd.to_numeric(df_coord['Longitude'], errors='coerce')
-    df_coord['COORDINATES'] = df_coord.apply(lambda x: [x['Longitude'], x['Latitude']], axis=1)
-    df_coord = df_coord[['Cidade', 'COORDINATES']]
+    df_coord = load_data('Coordenadas!A:C')[['Cidade', 'Latitude', 'Longitude']]
+    cubo = cubo.merge(df_coord, on='Cidade', how='inner')
+    cubo = cubo.dropna(subset=['Latitude', 'Longitude'])
 
-    df = df_equip.merge(df_coord, on='Cidade', how='left')
-    df.rename(columns={'Cidade': 'ADDRESS', 'LOCALIZAÇÃO': 'SPACES'}, inplace=True)
+    return cubo.astype({'LOCALIZAÇÃO': 'category', 'Classe': 'category'})
 
-    if cliente_filtro:
-        df = df.loc[df['SPACES'].isin(cliente_filtro)]
 
-    if classe_filtro:
-        df = df.loc[df['Classe'].isin(classe_filtro)]
+def mapa_cidades(cliente_filtro, classe_filtro):
+    # Not cached: each filter combination is two lookups on the cached cube
+    df = cubo_mapa()
+    df = df.loc[mascara(df['LOCALIZAÇÃO'], cliente_filtro) & mascara(df['Classe'], classe_filtro)]
+
+    # One row per city, the grid sums the machine counts instead of points
+    df = df.groupby(['Cidade', 'Latitude', 'Longitude'], as_index=False)['QUANTIDADE'].sum()
 
     layer = pdk.Layer(
         "GridLayer",
@@ -60,8 +54,11 @@ def mapa_cidades(cliente_filtro, classe_filtro):
         auto_highlight=True,
         elevation_scale=200,
         elevation_range=[0, 100],
-        get_position="COORDINATES",
-        get_elevation='SPACES',
+        get_position='[Longitude, Latitude]',
+        get_elevation_weight='QUANTIDADE',
+        elevation_aggregation='SUM',
+        get_color_weight='QUANTIDADE',
+        color_aggregation='SUM',
         opacity=0.15
     )
 
@@ -81,7 +78,7 @@ def mapa_cidades(cliente_filtro, classe_filtro):
     return r
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
 def filtro_cliente():
     df = load_data('Lista de Equipamentos!A:AY')
     df['LOCALIZAÇÃO'] = df['LOCALIZAÇÃO'].str.strip()
@@ -93,7 +90,7 @@ def filtro_cliente():
     return equipamentos
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
 def filtro_classe():
     df = load_data('Lista de Equipamentos!A:AY')
     df['Classe'] = df['Classe'].str.strip()
@@ -105,7 +102,7 @@ def filtro_classe():
     return equipamentos
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
 def preventiva_anual():
     line_chart1_data = preventiva_historico()
     colors = ['#2986cc', '#FF4B4B']
@@ -136,12 +133,11 @@ def preventiva_anual():
     return fig
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned(ttl=600)
 def ranking_clientes(dias):
-    df_hist = hist_handler(load_data("HISTORICO_DATA!A:Y"))
-    df_hist = df_hist.loc[df_hist['TIPO DE MANUTENÇÃO'] == 'CORRETIVA', ['Nº de Série', 'DATA TRABALHO']]
     data_filtro = calcula_data(dias)
-    df_hist = df_hist.loc[df_hist['DATA TRABALHO'] >= data_filtro]
+    df_hist = historico_entre('DATA TRABALHO', data_filtro)
+    df_hist = df_hist.loc[df_hist['TIPO DE MANUTENÇÃO'] == 'CORRETIVA', ['Nº de Série', 'DATA TRABALHO']]
 
     df_equip = load_data('Lista de Equipamentos!A:AY')
     df_equip['LOCALIZAÇÃO'] = df_equip['LOCALIZAÇÃO'].str.strip()
@@ -150,7 +146,7 @@ def ranking_clientes(dias):
     df = df_hist.merge(df_equip, on='Nº de Série', how='left')
     df = df.dropna(subset=['LOCALIZAÇÃO'])
 
-    df = df.groupby(by='LOCALIZAÇÃO', as_index=False).count()
+    df = df.groupby(by='LOCALIZAÇÃO', as_index=False, observed=True).count()
     df = df.sort_values(by='Nº de Série')
     df = df.tail(10)
 
@@ -174,38 +170,16 @@ def ranking_clientes(dias):
     return fig
 
 
-with open('style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-
-authenticator.login(fields={'Form name': 'Dashboard Joinville',
-                            'Username': 'Usuário',
-                            'Password': 'Senha'})
-
-if st.session_state['authentication_status']:
-    try:
-        with st.sidebar:
-            st.image('img/logo_new.png', use_column_width='auto')
-            st.page_link('Home.py', label='Home', icon='🏠')
-            st.page_link('pages/Corretiva.py', label='Corretiva', icon='🔩')
-            st.page_link('pages/Preventiva.py', label='Preventiva', icon='📆')
-
-            st.divider()
-
-            if st.button('Recarregar', type='primary'):
-                st.cache_data.clear()
-
-            st.divider()
+@painel
+def mapa_ativos():
+    r1c1, r1c2 = st.columns([2, 5])
 
-            authenticator.logout(button_name='Sair')
-
-        r1c1, r1c2 = st.columns([2, 5])
-
-        with r1c1:
-            st.subheader('Equipamentos Ativos')
-            cliente_filtro = st.multiselect('Clientes', filtro_cliente(), placeholder='Selecione os Clientes')
-            classe_filtro = st.multiselect('Classe', filtro_classe(),
-                                           placeholder='Selecione as Classes',
-                                           help='''
+    with r1c1:
+        st.subheader('Equipamentos Ativos')
+        cliente_filtro = st.multiselect('Clientes', filtro_cliente(), placeholder='Selecione os Clientes')
+        classe_filtro = st.multiselect('Classe', filtro_classe(),
+                                       placeholder='Selecione as Classes',
+                                       help='''
                                                     I: Contrabalançada Elétrica\n
                                                     II: Empilhadeira para armanezagem vertical (Ex: Retrátil)\n
                                                     III: Empilhadeira e transpaleteira com operador a pé\n
@@ -214,28 +188,55 @@ if st.session_state['authentication_status']:
                                                     VI: Rebocadores\n
                                                     AA: Plataformas''')
 
-        with r1c2:
-            st.pydeck_chart(mapa_cidades(cliente_filtro, classe_filtro))
+    with r1c2:
+        st.pydeck_chart(mapa_cidades(cliente_filtro, classe_filtro))
+
+
+@painel
+def grafico_preventiva():
+    st.plotly_chart(preventiva_anual(), use_container_width=True)
+
+
+@painel
+def grafico_ranking():
+    a, b = st.columns([6, 3])
+
+    with b:
+        dias = st.radio(label="Dias", options=[30, 60, 90], horizontal=True)
+
+    st.plotly_chart(ranking_clientes(dias), use_container_width=True)
+
+
+if st.session_state['authentication_status']:
+    # Heavy imports wait for the login, the form renders without them
+    import pandas as pd
+    import plotly.express as px
+    import pydeck as pdk
+
+    from config import (calcula_data, clear_caches, historico_entre, load_data, mascara,
+                        preventiva_historico, refresh, ultima_atualizacao)
+
+    try:
+        refresh(RANGES)
 
-        a, b = st.columns([12, 3])
+        barra_lateral(authenticator, RANGES)
 
-        with b:
-            dias = st.radio(label="Dias", options=[30, 60, 90], horizontal=True)
+        mapa_ativos()
 
         r2c1, r2c2 = st.columns(2)
 
         with r2c1:
-            st.plotly_chart(preventiva_anual(), use_container_width=True)
+            grafico_preventiva()
 
         with r2c2:
-            st.plotly_chart(ranking_clientes(dias), use_container_width=True)
+            grafico_ranking()
 
         st.toast(f'Bem vindo {st.session_state["name"]}')
         st.toast(f'''Última Atualização:\n{ultima_atualizacao()}''', icon='📋')
 
     except TimeoutError:
         st.toast('Carregando. Por favor aguarde')
-        st.cache_data.clear()
+        clear_caches()
 
     except Exception as e:
         st.write('Favor contate o administrador')
@@ -0,0 +1,164 @@
+'''
+Times, in fresh processes, a page from its first line to the rendered login
+form, and from there to its first chart. The baseline page imports
+everything at the top, as Home.py and its config.py did before bootstrap;
+the bootstrap page calls iniciar() and imports the rest once authenticated.
+
+Pages run under streamlit.testing's AppTest, in a scratch directory with a
+throwaway config.yaml. Importing streamlit and AppTest itself is left out
+of both timings.
+
+    python benchmarks/bench_bootstrap.py
+'''
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The baseline Home.py down to its login form, with the imports of the
+# baseline config.py pinned here so later changes to config.py do not leak in
+BASELINE = '''
+import calendar
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import plotly.express as px
+import pydeck as pdk
+import streamlit as st
+import streamlit_authenticator as stauth
+import yaml
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from yaml.loader import SafeLoader
+
+st.set_page_config(page_title="Gestão de Frotas",
+                   page_icon="🛠",
+                   layout='wide')
+
+with open('./config.yaml') as file:
+    configuration = yaml.load(file, Loader=SafeLoader)
+
+authenticator = stauth.Authenticate(
+    configuration['credentials'],
+    configuration['cookie']['name'],
+    configuration['cookie']['key'],
+    configuration['cookie']['expiry_days'],
+    configuration['pre-authorized']
+)
+
+with open('style.css') as f:
+    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+
+authenticator.login(fields={'Form name': 'Dashboard Joinville',
+                            'Username': 'Usuário',
+                            'Password': 'Senha'})
+'''
+
+# The top of the current Home.py
+BOOTSTRAP = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+
+import streamlit as st
+
+from bootstrap import barra_lateral, iniciar
+from ui import painel
+
+authenticator = iniciar()
+'''
+
+LAYOUTS = {
+    'baseline': (BASELINE, ''),
+    # What Home imports once the user is authenticated
+    'bootstrap': (BOOTSTRAP, '''
+import pandas as pd
+import plotly.express as px
+import pydeck as pdk
+import config
+'''),
+}
+
+# The Preventiva Anual line, the first chart of Home
+CHART = '''
+import pandas as pd
+import plotly.express as px
+df = pd.DataFrame({'Data': pd.date_range('2022-01-01', periods=36, freq='MS'),
+                   'Porcentagem Realizada': 0.5, 'Porcentagem em Conformidade': 0.4})
+px.line(df, x='Data', y=['Porcentagem Realizada', 'Porcentagem em Conformidade'],
+        markers=True).to_json()
+'''
+
+SCRIPT = '''
+import sys
+import time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+
+page = AppTest.from_string({page!r}, default_timeout=120)
+start = time.perf_counter()
+page.run()
+login = time.perf_counter() - start
+
+labels = [widget.label for widget in page.text_input]
+assert not page.exception, page.exception
+assert labels == ['Usuário', 'Senha'], labels
+
+{after_login}
+{chart}
+print(login, time.perf_counter() - start)
+'''
+
+CONFIG = {
+    'credentials': {'usernames': {'bench': {'email': 'bench@example.com', 'name': 'Bench',
+                                            'password': 'not-a-hash'}}},
+    'cookie': {'name': 'bench', 'key': 'bench', 'expiry_days': 1},
+    'pre-authorized': {'emails': []},
+}
+
+
+def scratch():
+    '''Directory with the files the login needs and a throwaway config.yaml'''
+    directory = tempfile.mkdtemp(prefix='bench_bootstrap_')
+    shutil.copy(os.path.join(ROOT, 'style.css'), directory)
+    with open(os.path.join(directory, 'config.yaml'), 'w') as file:
+        yaml.safe_dump(CONFIG, file)
+
+    return directory
+
+
+def measure(page, after_login, directory, repeat=5):
+    script = SCRIPT.format(root=ROOT, page=page, after_login=after_login, chart=CHART)
+
+    logins, charts = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', script], cwd=directory, capture_output=True,
+                             text=True, check=True).stdout.split()
+        logins.append(float(out[-2]))
+        charts.append(float(out[-1]))
+
+    return statistics.median(logins), statistics.median(charts)
+
+
+def main():
+    directory = scratch()
+    try:
+        print(f"{'layout':<10} {'login (ms)':>12} {'1º gráfico (ms)':>16}")
+        for layout, (page, after_login) in LAYOUTS.items():
+            login, chart = measure(page, after_login, directory)
+            print(f'{layout:<10} {login * 1000:>12.0f} {chart * 1000:>16.0f}')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
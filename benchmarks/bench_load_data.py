@@ -0,0 +1,78 @@
+'''
+Compares the legacy column-by-column table builder of load_data with
+config.build_table on synthetic HISTORICO_DATA / Lista de Equipamentos
+payloads.
+
+    python benchmarks/bench_load_data.py
+'''
+import copy
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import build_table  # noqa: E402
+
+
+def legacy_table(values, tolerance=0.7):
+    data = {}
+    table_len = len(values[0])
+    for j, column in enumerate(values[0]):
+        column_list = []
+        for i, row in enumerate(values):
+            if i == 0:
+                continue
+            if len(row) != table_len:
+                while len(row) != table_len + 1:
+                    row.append("")
+
+            if not row.count("") > tolerance*table_len:
+                column_list.append(row[j])
+
+        data[column] = column_list
+        df = pd.DataFrame(data=data)
+
+    return df
+
+
+def payload(rows, columns, seed=0):
+    '''Ragged rows with trailing blanks, like the Sheets API returns them'''
+    rng = random.Random(seed)
+    values = [[f'COLUNA {j}' for j in range(columns)]]
+    for i in range(rows):
+        row = [f'{i}-{j}' if rng.random() > 0.1 else "" for j in range(columns)]
+        values.append(row[:rng.randint(1, columns)])
+
+    return values
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    df = func(values)
+    return df, time.perf_counter() - start
+
+
+def main():
+    print(f"{'colunas':>8} {'linhas':>8} {'legado (s)':>12} {'build_table (s)':>16}")
+    for columns in (25, 51):
+        for rows in (1_000, 10_000, 100_000, 200_000):
+            values = payload(rows, columns)
+            new, new_time = timed(build_table, values)
+
+            # The legacy builder is quadratic in columns, skip it on the big inputs
+            if rows <= 10_000:
+                old, old_time = timed(legacy_table, copy.deepcopy(values))
+                pd.testing.assert_frame_equal(old, new)
+                old_time = f'{old_time:.3f}'
+            else:
+                old_time = '-'
+
+            print(f'{columns:>8} {rows:>8} {old_time:>12} {new_time:>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Reports the memory of the HISTORICO_DATA and Lista de Equipamentos tables
+before and after the categorical compaction of config.parse_table, and
+times the equality filters the pages run on them.
+
+    python benchmarks/bench_memory.py
+'''
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CATEGORIES, SCHEMAS, apply_schema, build_table, compact  # noqa: E402
+
+HISTORICO = 'HISTORICO_DATA!A:Y'
+LISTA = 'Lista de Equipamentos!A:AY'
+
+
+def historico_payload(rows, seed=0):
+    '''Unformatted HISTORICO_DATA rows, with serial dates and durations'''
+    rng = random.Random(seed)
+    header = ['CÓDIGO OS G4', 'CÓDIGO OS APOLLO', 'Nº de Série', 'FROTA', 'RAZÃO SOCIAL',
+              'DATA ABERTURA OS', 'DATA TRABALHO', 'DURAÇÃO IDA', 'DURAÇÃO TRABALHO',
+              'DURAÇÃO VOLTA', 'TIPO DE MANUTENÇÃO', 'STATUS ATENDIMENTO',
+              'STATUS DO EQUIPAMENTO', 'HORÍMETRO', 'PENDÊNCIA', 'COMENTÁRIO DO TÉCNICO',
+              'NOME TÉCNICO']
+    values = [header]
+    for i in range(rows):
+        aberta = 45000 + rng.random() * 700
+        values.append([f'{100000 + i}-1', f'AP{rng.randint(0, 6000)}', f'S{rng.randint(0, 2000)}',
+                       f'F{i}', f'CLIENTE {rng.randint(0, 150)}', aberta, aberta + rng.random(),
+                       rng.random() / 24, rng.random() / 8, rng.random() / 24,
+                       rng.choice(['CORRETIVA', 'INSPEÇÃO PREVENTIVA', 'INSTALAÇÃO']),
+                       rng.choice(['Validado', 'Concluido', 'Cancelado', 'Pendente']),
+                       rng.choice(['Equipamento operando', 'Equipamento em vias de parar',
+                                   'Equipamento parado', '']),
+                       rng.randint(1, 20000), rng.choice(['Sim', 'Não']),
+                       f'comentário {rng.randint(0, 10 ** 6)}', f'TÉCNICO {rng.randint(0, 40)}'])
+
+    return values
+
+
+def lista_payload(rows, seed=0):
+    rng = random.Random(seed)
+    header = ['Máquina', 'Nº de Série', 'Modelo', 'Status', 'LOCALIZAÇÃO', 'Classe', 'Cidade']
+    values = [header]
+    for i in range(rows):
+        values.append([f'M{i}', f'S{i}', f'MODELO {rng.randint(0, 30)}',
+                       rng.choice(['ATIVO', 'INATIVO']), f'CLIENTE {rng.randint(0, 150)}',
+                       rng.choice(['I', 'II', 'III', 'IV', 'V', 'VI', 'AA']),
+                       f'CIDADE {rng.randint(0, 40)}'])
+
+    return values
+
+
+def timed_filters(df, filters):
+    start = time.perf_counter()
+    for _ in range(20):
+        for column, value in filters:
+            (df[column] == value).sum()
+
+    return (time.perf_counter() - start) / 20
+
+
+def report(range_data, values, filters):
+    df = build_table(values)
+    if range_data in SCHEMAS:
+        df = apply_schema(df, SCHEMAS[range_data])
+    before = df.memory_usage(deep=True).sum()
+    before_time = timed_filters(df, filters)
+
+    df = compact(df.copy(), CATEGORIES[range_data])
+    after = df.memory_usage(deep=True).sum()
+    after_time = timed_filters(df, filters)
+
+    print(f'{range_data:<28} {len(df):>8} {before / 2 ** 20:>10.1f} {after / 2 ** 20:>10.1f} '
+          f'{before_time * 1000:>12.2f} {after_time * 1000:>12.2f}')
+
+
+def main():
+    print(f"{'tabela':<28} {'linhas':>8} {'antes MiB':>10} {'depois MiB':>10} "
+          f"{'filtros (ms)':>12} {'compacto (ms)':>12}")
+    for rows in (10_000, 100_000):
+        report(HISTORICO, historico_payload(rows),
+               [('TIPO DE MANUTENÇÃO', 'CORRETIVA'), ('STATUS ATENDIMENTO', 'Validado'),
+                ('STATUS DO EQUIPAMENTO', 'Equipamento parado')])
+    report(LISTA, lista_payload(3_000), [('Status', 'ATIVO'), ('LOCALIZAÇÃO', 'CLIENTE 1')])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''
+Shell shared by every page: page config, CSS, login form and sidebar.
+
+config.yaml, style.css and the logo are read once per process. The
+Authenticate object is still built on every rerun, it keeps the cookie
+and login state of the session calling it. Only streamlit, yaml and the
+authenticator are imported before login, the pages import plotly, pydeck
+and config (googleapiclient) once the user is authenticated.
+'''
+import streamlit as st
+import streamlit_authenticator as stauth
+import yaml
+from yaml.loader import SafeLoader
+
+PAGINAS = [
+    ('Home.py', 'Home', '🏠'),
+    ('pages/Corretiva.py', 'Corretiva', '🔩'),
+    ('pages/Preventiva.py', 'Preventiva', '📆'),
+]
+
+
+@st.cache_data(show_spinner=False)
+def configuracao():
+    '''Parsed config.yaml, a fresh copy per call since Authenticate writes to it'''
+    with open('./config.yaml') as file:
+        return yaml.load(file, Loader=SafeLoader)
+
+
+@st.cache_resource(show_spinner=False)
+def estilo():
+    with open('style.css') as f:
+        return f'<style>{f.read()}</style>'
+
+
+@st.cache_resource(show_spinner=False)
+def logo():
+    with open('img/logo_new.png', 'rb') as f:
+        return f.read()
+
+
+def iniciar():
+    '''Renders the page config, CSS and login form, returns the authenticator'''
+    st.set_page_config(page_title="Gestão de Frotas",
+                       page_icon="🛠",
+                       layout='wide')
+
+    configuration = configuracao()
+    authenticator = stauth.Authenticate(
+        configuration['credentials'],
+        configuration['cookie']['name'],
+        configuration['cookie']['key'],
+        configuration['cookie']['expiry_days'],
+        configuration['pre-authorized']
+    )
+
+    st.markdown(estilo(), unsafe_allow_html=True)
+
+    authenticator.login(fields={'Form name': 'Dashboard Joinville',
+                                'Username': 'Usuário',
+                                'Password': 'Senha'})
+
+    return authenticator
+
+
+def barra_lateral(authenticator, ranges, filtros=None):
+    '''
+        Sidebar with the logo, the page links, the reload button and logout.
+        filtros renders the page's own widgets under the links, its result
+        is returned.
+    '''
+    from config import refresh
+
+    with st.sidebar:
+        st.image(logo(), use_column_width='auto')
+        for pagina, rotulo, icone in PAGINAS:
+            st.page_link(pagina, label=rotulo, icon=icone)
+
+        st.divider()
+
+        selecao = None
+        if filtros is not None:
+            selecao = filtros()
+            st.divider()
+
+        if st.button('Recarregar', type='primary'):
+            refresh(ranges, force=True)
+
+        st.divider()
+
+        authenticator.logout(button_name='Sair')
+
+    return selecao
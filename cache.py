@@ -0,0 +1,49 @@
+'''
+st.cache_data keyed on the generation of the shared tables.
+
+A result computed from the tables of one generation is never served under
+another one, even when the computation ends after the tables changed, so
+nothing has to be cleared for the caches to follow the data. Only
+streamlit is imported here: pages decorate their functions before the
+login, config is imported on the first call.
+'''
+import functools
+
+import streamlit as st
+
+# Page scripts run again on every rerun, each function keeps one entry
+_caches = {}
+
+
+def versioned(ttl=None):
+    '''
+        Caches func per generation of config.registry and per argument,
+        expiring entries after ttl seconds when given
+    '''
+    def decorator(func):
+        def cached(generation, *args, **kwargs):
+            return func(*args, **kwargs)
+
+        # st.cache_data tells cached functions apart by module and name
+        cached.__module__ = func.__module__
+        cached.__qualname__ = func.__qualname__
+        cached = st.cache_data(ttl=ttl, show_spinner=False)(cached)
+        _caches[func.__module__, func.__qualname__] = cached
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            from config import registry
+            return cached(registry.generation, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def drop_old_generations():
+    '''
+        Frees the entries of the versioned caches. They are never served once
+        the generation moves on, this only returns their memory.
+    '''
+    for cached in list(_caches.values()):
+        cached.clear()
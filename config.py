@@ -1,18 +1,26 @@
 import calendar
+import hashlib
+import json
 import os
-from datetime import date, datetime, timedelta
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from cache import drop_old_generations, versioned
+from datasets import Dataset, Refresher, Registry, SnapshotStore
+from sheets import SheetsClient, TokenBucket, backoff
+
 SPREADSHEET_ID = '1zPlBWcCxCRqLOCe5tWfIPdfcuMB78KIoro4u4Y6hh5E'
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-DISCOVERY_SERVICE_URL = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
 MONTHS = {
     "janeiro": 1,
     "fevereiro": 2,
@@ -27,10 +35,48 @@ MONTHS = {
     "novembro": 11,
     "dezembro": 12
 }
-
-
-@st.cache_data(ttl=600, show_spinner=False)
-def get_service(creds=None):
+# Years offered on the Preventiva page
+ANOS = ["2022", "2023", "2024"]
+
+# Sheets read quota per minute and user. The bucket refills slower than the
+# quota by its burst, so even a burst followed by a full minute stays under it
+READ_QUOTA = 60
+READ_BURST = 10
+
+# Wide ranges read column by column, only the headers the pages use
+PROJECTIONS = {
+    'Lista de Equipamentos!A:AY': ['Máquina', 'Nº de Série', 'Modelo', 'Status', 'LOCALIZAÇÃO',
+                                   'Classe', 'Cidade', 'Periodicidade', 'Inicio periodicidade'],
+}
+# Header row of each projected range, read once per process
+_headers = {}
+
+# Append-only ranges, synced by fetching only the rows past the last load
+INCREMENTAL = {'HISTORICO_DATA!A:Y'}
+# Leading rows hashed to detect edits that rule out an incremental sync.
+# Edits to later rows are only seen by a full reload, see tail_ranges
+SAMPLE_ROWS = 50
+
+# Where the last good tables are kept between restarts, one folder per table
+# layout so a layout change never restores frames of the previous one
+SNAPSHOT_DIR = os.path.join('.cache', 'snapshots', 'v5')
+
+# One parsed, read-only table per range, shared by every session of the process
+registry = Registry(store=SnapshotStore(SNAPSHOT_DIR))
+_revalidate_lock = threading.Lock()
+
+# Seconds between two background rounds of token renewal and LOG reads
+REFRESH_INTERVAL = 30
+# Background rounds between two full reloads, which catch edits to rows an
+# incremental sync does not compare
+FULL_RESYNC_ROUNDS = 120
+_version_state = {'row': 1, 'value': None, 'rounds': 0}
+
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    '''One Sheets client per process, shared by every session and thread'''
+    creds = None
     if os.path.exists('token.json'):
         creds = Credentials.from_authorized_user_file(
             'token.json', SCOPES)
@@ -46,107 +92,744 @@ def get_service(creds=None):
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
 
-    try:
-        service = build('sheets', 'v4', credentials=creds)
-        return service
+    limiter = TokenBucket(rate=(READ_QUOTA - READ_BURST) / 60, capacity=READ_BURST)
+    return SheetsClient(creds, token_path='token.json', limiter=limiter)
 
-    except Exception:
-        service = build('sheets', 'v4', credentials=creds,
-                        discoveryServiceUrl=DISCOVERY_SERVICE_URL)
 
-        return service
+def build_table(values, tolerance=0.7, typed=None):
+    '''
+        Turns a Sheets values payload into a dataframe in a single pass.
+        typed maps header names to unformatted columns, aligned with values,
+        that replace the formatted cells of those columns.
+    '''
+    header = values[0]
+    width = len(header)
+    body = values[1:]
+
+    # Pad or truncate ragged rows once, so the table is rectangular
+    rows = [row[:width] + [""] * (width - len(row)) for row in body]
+    table = np.array(rows, dtype=object).reshape(len(rows), width)
+
+    # Repeated header names resolve to their last column
+    positions = {column: j for j, column in enumerate(header)}
+    for column, cells in (typed or {}).items():
+        cells = cells[1:len(values)]
+        table[:, positions[column]] = cells + [""] * (len(body) - len(cells))
+
+    # Short rows used to be padded one cell past the header, which counted
+    # as an extra empty cell against the tolerance
+    lengths = np.fromiter(map(len, body), dtype=np.int64, count=len(body))
+    empty = (table == "").sum(axis=1) + (lengths < width)
+    table = table[empty <= tolerance*width]
+
+    # Repeated header names keep their first position and their last column
+    table = table[:, list(positions.values())]
+
+    return pd.DataFrame(data=table, columns=list(positions))
+
+
+def render_options(typed, by_columns=False):
+    '''
+        Typed reads get numbers as numbers and dates as day serials, not
+        display text. Reads by columns return one list per column.
+    '''
+    options = {}
+    if typed:
+        options['valueRenderOption'] = 'UNFORMATTED_VALUE'
+        options['dateTimeRenderOption'] = 'SERIAL_NUMBER'
+    if by_columns:
+        options['majorDimension'] = 'COLUMNS'
+
+    return options
+
+
+def fetch_values(range_data, max_attempts=5, typed=False):
+    '''Returns the raw values of a range, or None once every attempt failed'''
+    for attempt in range(max_attempts):
+        try:
+            # Get return from google sheets API
+            client = get_client()
+            result = client.execute(client.values().get(
+                spreadsheetId=SPREADSHEET_ID, range=range_data, **render_options(typed)))
+
+            return result['values']
+        except HttpError as error:
+            print(f"Attempt {attempt}:{error}")
+            delay = backoff(error, attempt)
+            if delay is None:
+                break
+            if attempt + 1 < max_attempts:
+                time.sleep(delay)
+
+    print('Max attempts reached')
+    return None
+
+
+def fetch_batch(ranges, max_attempts=5, typed=False, by_columns=False):
+    '''
+        Returns the raw values of every range from a single batchGet, with None
+        for empty ranges, or None once every attempt failed
+    '''
+    for attempt in range(max_attempts):
+        try:
+            client = get_client()
+            result = client.execute(client.values().batchGet(
+                spreadsheetId=SPREADSHEET_ID, ranges=list(ranges), **render_options(typed, by_columns)))
+
+            # valueRanges come back in the same order as the requested ranges
+            return [value_range.get('values') for value_range in result['valueRanges']]
+        except HttpError as error:
+            print(f"Attempt {attempt}:{error}")
+            delay = backoff(error, attempt)
+            if delay is None:
+                break
+            if attempt + 1 < max_attempts:
+                time.sleep(delay)
+
+    print('Max attempts reached')
+    return None
+
+
+def serial_days(column):
+    '''Day serials as floats, NaN for blank or text cells'''
+    return pd.to_numeric(column, errors='coerce').astype('float64')
+
+
+def apply_schema(df, schema):
+    '''
+        Converts the declared columns of a typed table with plain arithmetic on
+        their serials. Every other column was read formatted and stays as is.
+    '''
+    for column in df.columns:
+        kind = schema.get(column)
+        if kind == 'datetime':
+            seconds = (serial_days(df[column]) * 86400).round()
+            df[column] = SERIAL_EPOCH + pd.to_timedelta(seconds, unit='s')
+        elif kind == 'timedelta':
+            seconds = (serial_days(df[column]) * 86400).round()
+            df[column] = pd.to_timedelta(seconds, unit='s')
+        elif kind == 'percent':
+            df[column] = (serial_days(df[column]) * 100).round(10)
+        elif kind == 'float':
+            df[column] = serial_days(df[column])
+
+    return df
+
+
+def compact(df, columns):
+    '''Stores repetitive text columns as categoricals, one code per row'''
+    for column in columns:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+def align_categories(old, new):
+    '''Gives both tables the union of their categories, so concat keeps them'''
+    for column in old.columns:
+        if isinstance(old[column].dtype, pd.CategoricalDtype) and column in new.columns:
+            categories = old[column].cat.categories.union(new[column].cat.categories)
+            old[column] = old[column].cat.set_categories(categories)
+            new[column] = new[column].cat.set_categories(categories)
+
+    return old, new
+
+
+def mascara(serie, valores):
+    '''
+        Rows of a categorical series whose value is in valores, all of them
+        when valores is empty. Looks the codes up in a table of the selected
+        categories instead of comparing text.
+    '''
+    if not valores:
+        return np.ones(len(serie), dtype=bool)
+
+    # The last slot answers both unknown values (-1 indexer) and nulls (-1 code)
+    selecionadas = np.zeros(len(serie.cat.categories) + 1, dtype=bool)
+    selecionadas[serie.cat.categories.get_indexer(list(valores))] = True
+    selecionadas[-1] = False
+
+    return selecionadas[serie.cat.codes.to_numpy()]
+
+
+def parse_table(range_data, values, tolerance=0.7, typed=None):
+    '''Builds the table of a range, types it by its schema and compacts it'''
+    df = build_table(values, tolerance, typed)
+    if range_data in SCHEMAS:
+        df = apply_schema(df, SCHEMAS[range_data])
+    if range_data in CATEGORIES:
+        df = compact(df, CATEGORIES[range_data])
+
+    return df
+
+
+def split_range(range_data):
+    '''Splits "Sheet!C5:H" into ('Sheet', 'C', 5, 'H')'''
+    sheet, cells = range_data.rsplit('!', 1)
+    start, end = cells.split(':')
+    first_column = start.rstrip('0123456789')
+    first_row = int(start[len(first_column):] or 1)
+
+    return sheet, first_column, first_row, end
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index*26 + ord(letter) - ord('A') + 1
+
+    return index - 1
+
+
+def column_letters(index):
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord('A') + rest) + letters
+
+    return letters
+
+
+def header_range(range_data):
+    sheet, first_column, first_row, last_column = split_range(range_data)
+    return f'{sheet}!{first_column}{first_row}:{last_column}{first_row}'
+
+
+def projection(range_data, header):
+    '''Names and single-column ranges of the projected headers, in sheet order'''
+    sheet, first_column, first_row, _ = split_range(range_data)
+    offset = column_index(first_column)
+
+    # Repeated names resolve to their last column, like build_table does
+    positions = {column: j for j, column in enumerate(header)}
+    wanted = sorted(positions[column] for column in PROJECTIONS[range_data] if column in positions)
+    letters = [column_letters(offset + j) for j in wanted]
+
+    return ([header[j] for j in wanted],
+            [f'{sheet}!{letter}{first_row}:{letter}' for letter in letters])
+
+
+def assemble(names, columns):
+    '''
+        Turns column payloads back into rows, as a plain read of those columns
+        would return them. Returns None when a column no longer starts with
+        the header it was fetched for.
+    '''
+    if [column[0] if column else '' for column in columns] != names:
+        return None
+
+    height = max(len(column) for column in columns)
+    rows = []
+    for row in zip(*[column + [''] * (height - len(column)) for column in columns]):
+        row = list(row)
+        # Rows come back without their trailing blanks
+        while row and row[-1] == '':
+            row.pop()
+        rows.append(row)
+
+    return rows
+
+
+def fetch_projection(range_data, max_attempts=5):
+    '''
+        Returns the rows of the projected columns of range_data, reading its
+        header first when it is not known yet, or None on failure
+    '''
+    for _ in range(2):
+        header = _headers.get(range_data)
+        if header is None:
+            payloads = fetch_batch([header_range(range_data)], max_attempts)
+            if payloads is None or payloads[0] is None:
+                return None
+            header = _headers[range_data] = payloads[0][0]
+
+        names, ranges = projection(range_data, header)
+
+        # Schema columns are read unformatted, the rest as Sheets shows them
+        schema = SCHEMAS.get(range_data, {})
+        payloads = {}
+        for typed in {name in schema for name in names}:
+            part = [r for name, r in zip(names, ranges) if (name in schema) == typed]
+            fetched = fetch_batch(part, max_attempts, typed, by_columns=True)
+            if fetched is None:
+                return None
+            payloads.update(zip(part, fetched))
+
+        # Each single-column range comes back as a list holding that column
+        values = assemble(names, [payloads[r][0] if payloads[r] else [] for r in ranges])
+        if values is not None:
+            return values
+
+        # Columns moved since the header was read, read it again
+        _headers.pop(range_data, None)
+
+    return None
+
+
+def typed_ranges(range_data, sub_range, header):
+    '''
+        Names and single-column ranges of the schema columns of range_data
+        over the rows of sub_range, a part of it
+    '''
+    if range_data not in SCHEMAS or not header:
+        return [], []
+
+    sheet, first_column, first_row, end = split_range(sub_range)
+    last_row = end[len(end.rstrip('0123456789')):]
+    offset = column_index(first_column)
+
+    positions = {column: j for j, column in enumerate(header)}
+    names = [column for column in SCHEMAS[range_data] if column in positions]
+    letters = [column_letters(offset + positions[column]) for column in names]
+
+    return names, [f'{sheet}!{letter}{first_row}:{letter}{last_row}' for letter in letters]
+
+
+def typed_part(range_data, ranges, payloads):
+    '''
+        The (range_data, rows, header) part whose schema columns will be
+        parsed from payloads, the formatted reads of ranges: the whole range,
+        or the tail of an incremental sync when it brought new rows
+    '''
+    if len(ranges) == 2:
+        tail = payloads[1]
+        header = registry.peek(range_data).meta['header'] if tail and len(tail) > 1 else None
+        return range_data, ranges[1], header
+
+    return range_data, ranges[0], payloads[0][0] if payloads[0] else None
+
+
+def fetch_typed(parts, max_attempts=5):
+    '''
+        Reads the schema columns of each (range_data, rows, header) part
+        unformatted, in one batchGet by columns. Returns a {name: column} dict
+        per part, empty for parts without schema columns, or None on failure.
+    '''
+    columns = [typed_ranges(*part) for part in parts]
+    ranges = [r for _, sub in columns for r in sub]
+    if not ranges:
+        return [{} for _ in parts]
+
+    payloads = fetch_batch(ranges, max_attempts, typed=True, by_columns=True)
+    if payloads is None:
+        return None
+
+    # Each single-column range comes back as a list holding that column
+    payloads = iter(payloads)
+    return [{name: (next(payloads) or [[]])[0] for name in names} for names, _ in columns]
+
+
+def checksum(values):
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode()).hexdigest()
+
+
+def indexed(range_data, dataset):
+    '''Builds the INDEXES and GROUPS of the dataset while it is still off the request path'''
+    for column in INDEXES.get(range_data, []):
+        dataset.sorted_by(column)
+    for column in GROUPS.get(range_data, []):
+        dataset.grouped_by(column)
+
+    return dataset
+
+
+def ingest(range_data, values, tolerance=0.7, typed=None):
+    '''Parses a full payload, remembering what is needed to sync its tail later'''
+    return indexed(range_data, Dataset(parse_table(range_data, values, tolerance, typed),
+                                       header=values[0],
+                                       rows=len(values),
+                                       last_row=values[-1],
+                                       checksum=checksum(values[:SAMPLE_ROWS])))
+
+
+def tail_ranges(range_data, dataset):
+    '''
+        Ranges holding the sampled prefix and every row from the last one
+        ingested. An incremental sync only notices edits to those rows: rows
+        in between are never compared, and edits to them wait for the next
+        full reload, forced or every FULL_RESYNC_ROUNDS.
+    '''
+    sheet, first_column, first_row, last_column = split_range(range_data)
+    last_row = first_row + dataset.meta['rows'] - 1
+
+    return [f'{sheet}!{first_column}{first_row}:{last_column}{first_row + SAMPLE_ROWS - 1}',
+            f'{sheet}!{first_column}{last_row}:{last_column}']
+
+
+def append_tail(range_data, dataset, prefix, tail, tolerance=0.7, typed=None):
+    '''
+        Appends the rows fetched past the last ingested one to the dataset.
+        Returns None when the header, the sampled prefix or the last ingested
+        row changed, since then only a full reload is safe.
+    '''
+    meta = dataset.meta
+    if not prefix or checksum(prefix) != meta['checksum']:
+        return None
+
+    # The tail starts at the last row already ingested, to catch edits to it
+    if not tail or tail[0] != meta['last_row']:
+        return None
+
+    df = dataset.frame
+    new_rows = parse_table(range_data, [meta['header']] + tail[1:], tolerance, typed)
+    if len(new_rows):
+        df = pd.concat(align_categories(df.copy(deep=False), new_rows), ignore_index=True)
+
+    return indexed(range_data, Dataset(df,
+                                       header=meta['header'],
+                                       rows=meta['rows'] + len(tail) - 1,
+                                       last_row=tail[-1],
+                                       checksum=meta['checksum']))
 
 
-@st.cache_data(ttl=600, show_spinner=False)
 def load_data(range_data, **kwargs):
-    '''Returns a table in pandas dataframe type'''
+    '''
+        Returns a read-only view of the shared table for range_data.
+        Ranges in INCREMENTAL only fetch the rows added since the last load,
+        ranges in SCHEMAS read their schema columns unformatted and type them,
+        every other column as Sheets shows it, and
+        ranges in PROJECTIONS only fetch the columns the pages use.
+    '''
 
     if 'max_attempts' in kwargs:
         max_attempts = kwargs['max_attempts']
     else:
-        max_attempts = 3
+        max_attempts = 5
 
     if 'tolerance' in kwargs and kwargs['tolerance'] >= 0.7:
         tolerance = kwargs['tolerance']
     else:
         tolerance = 0.7
 
-    for attempt in range(max_attempts):
-        try:
-            # Get return from google sheets API
-            service = get_service()
-            result = service.spreadsheets().values().get(
-                spreadsheetId=SPREADSHEET_ID, range=range_data).execute()
-
-            # Organize data to turn into dataframe
-            values = result['values']
-            data = {}
-            table_len = len(values[0])
-            for j, column in enumerate(values[0]):
-                column_list = []
-                for i, row in enumerate(values):
-                    if i == 0:
-                        continue
-                    if len(row) != table_len:
-                        while len(row) != table_len + 1:
-                            row.append("")
-
-                    if not row.count("") > tolerance*table_len:
-                        column_list.append(row[j])
-
-                data[column] = column_list
-                df = pd.DataFrame(data=data)
-
-            return df
-        except HttpError as error:
-            print(f"Attempt {attempt}:{error}")
+    def loader():
+        dataset = registry.peek(range_data)
+        if range_data in INCREMENTAL and dataset is not None:
+            ranges = tail_ranges(range_data, dataset)
+            payloads = fetch_batch(ranges, max_attempts)
+            typed = payloads and fetch_typed([typed_part(range_data, ranges, payloads)], max_attempts)
+            if typed is not None:
+                synced = append_tail(range_data, dataset, *payloads, tolerance, typed[0])
+                if synced is not None:
+                    return synced
+
+        # Projected ranges read their schema columns unformatted themselves
+        if range_data in PROJECTIONS:
+            values = fetch_projection(range_data, max_attempts)
+            typed = [{}]
+        else:
+            values = fetch_values(range_data, max_attempts)
+            typed = values and fetch_typed([typed_part(range_data, [range_data], [values])], max_attempts)
+        if values is None or typed is None:
+            return None
+        return ingest(range_data, values, tolerance, typed[0])
 
-    print('Max attempts reached')
-    return None
+    return registry.get(range_data, loader)
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+def load_batch(ranges, version=None, staging=None, full=False, **kwargs):
+    '''
+        Fetches every range not loaded under version, the registry version by
+        default, in one batchGet round trip per render mode, plus one per
+        projected range, and fills the registry. With a staging dict the new
+        datasets are collected there instead, for the caller to publish.
+        full reloads every range whole, fresh or incremental alike.
+    '''
+
+    if 'max_attempts' in kwargs:
+        max_attempts = kwargs['max_attempts']
+    else:
+        max_attempts = 5
+
+    # Incremental ranges already loaded only ask for their prefix and tail,
+    # projected ones are read by columns apart
+    requests = {}
+    projected = []
+    for range_data in ranges:
+        if not full and registry.is_fresh(range_data, version):
+            continue
+        if range_data in PROJECTIONS:
+            projected.append(range_data)
+            continue
+        dataset = registry.peek(range_data)
+        if range_data in INCREMENTAL and dataset is not None and not full:
+            requests[range_data] = tail_ranges(range_data, dataset)
+        else:
+            requests[range_data] = [range_data]
+
+    if not requests and not projected:
+        return
+
+    if version is None:
+        version = registry.version
+
+    def keep(range_data, dataset):
+        if staging is None:
+            registry.put(range_data, dataset, version)
+        else:
+            staging[range_data] = dataset
+
+    for range_data in projected:
+        values = fetch_projection(range_data, max_attempts)
+        if values is not None:
+            keep(range_data, ingest(range_data, values))
+
+    def resolve(requests):
+        '''Fetches and parses requests, returns the ranges whose tail sync was rejected'''
+        payloads = fetch_batch([r for sub in requests.values() for r in sub], max_attempts)
+        if payloads is None:
+            return []
+
+        payloads = iter(payloads)
+        fetched = {range_data: [next(payloads) for _ in sub] for range_data, sub in requests.items()}
+
+        # Then the schema columns of the rows about to be parsed, unformatted
+        typed = fetch_typed([typed_part(range_data, requests[range_data], values)
+                             for range_data, values in fetched.items()], max_attempts)
+        if typed is None:
+            return []
+
+        rejected = []
+        for (range_data, values), columns in zip(fetched.items(), typed):
+            if len(values) == 2:
+                dataset = append_tail(range_data, registry.peek(range_data), *values, typed=columns)
+                if dataset is None:
+                    rejected.append(range_data)
+            elif values[0] is not None:
+                dataset = ingest(range_data, values[0], typed=columns)
+            else:
+                dataset = None
+
+            if dataset is not None:
+                keep(range_data, dataset)
+
+        return rejected
+
+    # An edited prefix or last row rules the tail sync out, those ranges are
+    # read again whole in one more round trip
+    rejected = resolve(requests) if requests else []
+    if rejected:
+        print(f'Tail sync rejected, reloading {", ".join(rejected)} whole')
+        resolve({range_data: [range_data] for range_data in rejected})
+
+
+def probe_version(max_attempts=5):
+    '''
+        Reads the last cell of LOG!A:A, starting from the last row seen so only
+        the newest entries travel. Returns the (row, value) pair or None.
+    '''
+    row = _version_state['row']
+    payloads = fetch_batch([f'LOG!A{row}:A'], max_attempts)
+
+    # Nothing left at the last known row means the log shrank, read it whole
+    if payloads is not None and payloads[0] is None and row > 1:
+        row = 1
+        payloads = fetch_batch(['LOG!A1:A'], max_attempts)
+
+    if payloads is None or payloads[0] is None:
+        return None
+
+    values = payloads[0]
+    return row + len(values) - 1, values[-1][0]
+
+
+def revalidate(ranges=(), force=False, full=False):
+    '''
+        Reloads every table of the registry, plus ranges, under the newest LOG
+        entry and only then publishes it as the data version. The new tables
+        are staged aside and swapped in together, so requests keep reading
+        the last good ones meanwhile, and a partial reload publishes nothing
+        and is retried on the next round.
+
+        full re-reads every table whole, even under an unchanged version, so
+        edits an incremental sync cannot see are picked up.
+    '''
+    if not _revalidate_lock.acquire(blocking=False):
+        if not force:
+            return
+
+        # A forced call rides on the round in flight instead of starting
+        # another, unless it asks for a full reload that round is not doing
+        _revalidate_lock.acquire()
+        if not full:
+            registry.count_coalesced()
+            _revalidate_lock.release()
+            return
+
+    try:
+        probe = probe_version()
+        if probe is None:
+            return
+
+        version = f'{probe[0]}:{probe[1]}'
+
+        keys = set(registry.keys()) | set(ranges)
+        staged = {}
+        load_batch(keys, version, staged, full)
+        if not all(key in staged or registry.is_fresh(key, version) for key in keys):
+            return
+
+        # A full reload under the same version may still bring edited rows
+        edited = [key for key, dataset in staged.items()
+                  if registry.peek(key) is None or not registry.peek(key).frame.equals(dataset.frame)]
+
+        # Publishing moves the generation the derived caches are keyed on
+        changed = registry.publish(version, staged, edited=bool(edited))
+        _version_state['row'], _version_state['value'] = probe
+        if changed:
+            print(f'Data version {version}, {registry.coalesced} duplicate loads avoided')
+            drop_old_generations()
+        elif edited:
+            print(f'Full reload under {version} changed {", ".join(sorted(edited))}')
+            drop_old_generations()
+    finally:
+        _revalidate_lock.release()
+
+
+def keep_current():
+    '''
+        Background round: renews the token ahead of its expiry, then
+        revalidates, re-reading every table whole every FULL_RESYNC_ROUNDS.
+        A failed renewal still lets the round revalidate with the current
+        token, and each failure is logged on its own.
+    '''
+    _version_state['rounds'] += 1
+
+    try:
+        get_client().refresh_token()
+    except Exception as error:
+        print(f'Token refresh failed: {error}')
+
+    try:
+        revalidate(full=_version_state['rounds'] % FULL_RESYNC_ROUNDS == 0)
+    except Exception as error:
+        print(f'Revalidation failed: {error}')
+
+
+refresher = Refresher(keep_current, REFRESH_INTERVAL)
+
+
+def refresh(ranges, force=False):
+    '''
+        Serves the page from the tables already loaded or snapshotted and
+        leaves keeping them current to the background refresher. Only ranges
+        never loaded, or a forced reload, are fetched on the request path.
+        A forced reload re-reads every table whole.
+    '''
+    if force or any(registry.peek(r) is None for r in ranges):
+        revalidate(ranges, force=True, full=force)
+        # Without a version the tables are still loaded, just unstamped
+        load_batch([r for r in ranges if registry.peek(r) is None])
+
+    if _version_state['value'] is None:
+        restore_version(ranges)
+
+    refresher.start()
+
+
+def restore_version(ranges):
+    '''
+        Until the first LOG read, takes the LOG state from the newest version
+        the snapshots of ranges were saved under
+    '''
+    versions = [dataset.version for dataset in map(registry.peek, ranges)
+                if dataset is not None and dataset.version is not None]
+    if not versions:
+        return
+
+    # Versions are "row:value", the value may hold colons itself
+    row, value = max((version.split(':', 1) for version in versions), key=lambda v: int(v[0]))
+    _version_state['row'], _version_state['value'] = int(row), value
+
+
+def clear_caches():
+    '''Drops the shared tables and every derived cache'''
+    registry.clear()
+    st.cache_data.clear()
+
+
+@st.cache_data(show_spinner=False)
 def meses():
     return MONTHS
 
 
-@st.cache_data(ttl=600, show_spinner=False)
-def hist_handler(data):
-    df_hist = data
-    df_hist['DATA TRABALHO'] = pd.to_datetime(df_hist['DATA TRABALHO'],
-                                              errors='coerce',
-                                              dayfirst=True)
-    df_hist['DATA ABERTURA OS'] = pd.to_datetime(df_hist['DATA ABERTURA OS'],
-                                                 errors='coerce',
-                                                 dayfirst=True)
-    df_hist['DURAÇÃO IDA'] = pd.to_timedelta(df_hist['DURAÇÃO IDA'])
-    df_hist['DURAÇÃO TRABALHO'] = pd.to_timedelta(
-        df_hist['DURAÇÃO TRABALHO'])
-    df_hist['DURAÇÃO VOLTA'] = pd.to_timedelta(df_hist['DURAÇÃO VOLTA'])
-
-    return df_hist
+# Typed ranges and the kind of each converted column. Sheets day serials
+# count from 1899-12-30, durations are fractions of a day and percentages
+# come as fractions
+SCHEMAS = {
+    'HISTORICO_DATA!A:Y': {
+        'DATA ABERTURA OS': 'datetime',
+        'DATA TRABALHO': 'datetime',
+        'DURAÇÃO IDA': 'timedelta',
+        'DURAÇÃO TRABALHO': 'timedelta',
+        'DURAÇÃO VOLTA': 'timedelta',
+        'HORÍMETRO': 'float',
+    },
+    'PREVENTIVAS_MENSAL_PLT!A:E': {
+        'Data': 'datetime',
+        'Porcentagem Realizada': 'percent',
+        'Porcentagem em Conformidade': 'percent',
+    },
+    'OS Preventivas!C5:H': {
+        'Data': 'datetime',
+    },
+    'Coordenadas!A:C': {
+        'Latitude': 'float',
+        'Longitude': 'float',
+    },
+}
+SERIAL_EPOCH = pd.Timestamp('1899-12-30')
+
+# Date columns kept sorted, so date windows are binary searches
+INDEXES = {
+    'HISTORICO_DATA!A:Y': ['DATA ABERTURA OS', 'DATA TRABALHO'],
+}
 
+# Key columns with the row positions of each value, for per-key lookups
+GROUPS = {
+    'HISTORICO_DATA!A:Y': ['Nº de Série', 'CÓDIGO OS APOLLO'],
+}
 
-@st.cache_data(ttl=600, show_spinner=False)
+# Low-cardinality text columns kept as categoricals. Groupbys on them pass
+# observed=True, so only the values present in the rows come out
+CATEGORIES = {
+    'HISTORICO_DATA!A:Y': ['RAZÃO SOCIAL', 'TIPO DE MANUTENÇÃO', 'STATUS ATENDIMENTO',
+                           'STATUS DO EQUIPAMENTO', 'PENDÊNCIA', 'NOME TÉCNICO'],
+    'Lista de Equipamentos!A:AY': ['Modelo', 'Status', 'LOCALIZAÇÃO', 'Classe', 'Cidade'],
+}
+
+
+def historico():
+    '''Returns the parsed HISTORICO_DATA table'''
+    return load_data('HISTORICO_DATA!A:Y')
+
+
+def historico_entre(coluna, inicio=None, fim=None, ordenado=True):
+    '''
+        Returns the HISTORICO_DATA rows with inicio <= coluna <= fim, oldest
+        first, or in sheet order when ordenado is False
+    '''
+    historico()
+    return registry.peek('HISTORICO_DATA!A:Y').window(coluna, inicio, fim, sort=ordenado)
+
+
+def historico_de(coluna, chaves):
+    '''Returns the HISTORICO_DATA rows whose coluna is one of chaves, in sheet order'''
+    historico()
+    return registry.peek('HISTORICO_DATA!A:Y').lookup(coluna, chaves)
+
+
+@versioned()
 def equipamentos_ativos():
     df = load_data('Lista de Equipamentos!A:AY')
     df = df.loc[df['Status'] == 'ATIVO', 'Nº de Série']
     return list(df)
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
 def preventiva_historico():
-    df = load_data('PREVENTIVAS_MENSAL_PLT!A:E')
-    df['Data'] = pd.to_datetime(df['Data'],
-                                errors='coerce',
-                                dayfirst=True)
-    df['Porcentagem Realizada'] = df['Porcentagem Realizada'].str.replace('%', '').str.replace(',', '.')
-    df['Porcentagem em Conformidade'] = df['Porcentagem em Conformidade'].str.replace('%', '').str.replace(',', '.')
-
-    df['Porcentagem Realizada'] = pd.to_numeric(df['Porcentagem Realizada'], errors='coerce')
-    df['Porcentagem em Conformidade'] = pd.to_numeric(df['Porcentagem em Conformidade'], errors='coerce')
-
-    return df
+    return load_data('PREVENTIVAS_MENSAL_PLT!A:E')
 
 
 @st.cache_data(ttl=600, show_spinner=False)
@@ -158,76 +841,124 @@ def calcula_data(dias):
     return data_filtro
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@dataclass
+class StatusFrota:
+    '''Situação atual da frota ativa, agregada uma vez por versão dos dados'''
+    ultimos: pd.DataFrame
+    contagem: dict
+    por_cliente: pd.DataFrame
+    por_status: dict
+    pendencias: pd.DataFrame
+
+    def quantidade(self, status):
+        return self.contagem.get(status, 0)
+
+    def linhas(self, *status):
+        '''Last attendance rows of the machines in any of the given statuses'''
+        partes = [self.por_status[s] for s in status if s in self.por_status]
+        if not partes:
+            return self.ultimos.iloc[0:0]
+        return pd.concat(partes)
+
+
+@dataclass
+class KpiPreventiva:
+    '''Indicadores de preventiva de um mês'''
+    percentual: float
+    realizados: int
+    meta: int
+    por_cliente: pd.DataFrame
+
+
+@versioned()
 def ultimo_g4_equip(sorted_column):
     '''
         Retorna um dataframe com os ultimos atendimentos de cada equipamento ativo
     '''
     ativos = equipamentos_ativos()
-    historico_data = hist_handler(load_data('HISTORICO_DATA!A:Y'))
+    historico_data = historico_de('Nº de Série', ativos)
 
-    columns = historico_data.columns.values
-    historico_grouped = historico_data.set_index('Nº de Série')
+    # One stable sort and the last row per machine, invalid dates sort last
+    df = historico_data.loc[historico_data['STATUS DO EQUIPAMENTO'] != ""]
+    df = df.sort_values(by=sorted_column, kind='stable')
+    df = df.drop_duplicates(subset='Nº de Série', keep='last')
+    df = df.set_index('Nº de Série')
 
-    equipamentos = historico_grouped.index.values
-    equipamentos = list(set(list(equipamentos)))
+    # Rows follow the active list, with an unnamed index and an empty
+    # 'Nº de Série' column, as the pages expect
+    df = df.loc[[equip for equip in ativos if equip in df.index]]
+    df.index.name = None
+    df.insert(historico_data.columns.get_loc('Nº de Série'), 'Nº de Série',
+              np.full(len(df), np.nan, dtype=object))
 
-    result = pd.DataFrame(columns=columns)
+    return df
 
-    for equip in ativos:
-        if equip in equipamentos:
-            df_aux = historico_grouped.loc[[equip]]
-            df_aux = df_aux.loc[df_aux['STATUS DO EQUIPAMENTO'] != ""]
-            df_aux = df_aux.sort_values(by=sorted_column)
-            df_aux = df_aux.tail(1)
 
-            result = pd.concat([result, df_aux])
-        else:
-            continue
+def periodicidade(df):
+    '''
+        Parses 'Periodicidade' (A/B/C plus the starting month) and 'Inicio
+        periodicidade' into the starting month, the frequency and the month
+        ordinal (ano*12 + mes - 1) the schedule starts at
+    '''
+    per = df['Periodicidade']
+    mes_inicio = np.where(per.str.len() == 2, per.str[-1:], per.str[-2:]).astype(int)
+    frequencia = np.select([per.str[:1] == 'A', per.str[:1] == 'B'], [1, 2], 3)
+    inicio = df['Inicio periodicidade'].astype(int).to_numpy()*12 + mes_inicio - 1
 
-    return result
+    return mes_inicio, frequencia, inicio
 
 
-@st.cache_data(ttl=600, show_spinner=False)
-def cronograma(mes, ano):
+def programada(mes_inicio, frequencia, inicio, datas):
+    '''Boolean matrix equipment x month, True when the preventive is due'''
+    mes = datas.month.to_numpy()
+    ordinal = datas.year.to_numpy()*12 + mes - 1
+
+    # Odd starting months fall due one month earlier in the cycle
+    devida = (mes[None, :] + (mes_inicio % 2)[:, None]) % frequencia[:, None] == 0
+
+    return devida & (ordinal[None, :] > inicio[:, None])
 
-    def func(row, date_input):
-        if date_input > row['data_aux']:
-            if int(row['pmes_aux']) % 2 == 0:
-                x = True if mes % int(row['pfreq_aux']) == 0 else False
-            else:
-                x = True if (mes + 1) % int(row['pfreq_aux']) == 0 else False
-        else:
-            x = False
-        return x
 
+@versioned()
+def agenda_preventiva():
+    '''
+        Retorna os equipamentos ativos e a matriz equipamento x mês com as
+        preventivas programadas em todos os meses selecionáveis
+    '''
     df_equip = load_data("Lista de Equipamentos!A:AY")
-    df = df_equip.loc[df_equip['Status'] == 'ATIVO']
+    df = df_equip.loc[df_equip['Status'] == 'ATIVO',
+                      ['Nº de Série', 'Periodicidade', 'Classe', 'Inicio periodicidade',
+                       'LOCALIZAÇÃO', 'Máquina', 'Modelo', 'Cidade']]
+    df.rename(columns={'Nº de Série': 'Série'}, inplace=True)
 
-    df_os = load_data('OS Preventivas!C5:H')
-    df_os['Data'] = pd.to_datetime(df_os['Data'],
-                                   errors='coerce',
-                                   dayfirst=True)
+    datas = pd.date_range(f'{ANOS[0]}-01-01', f'{ANOS[-1]}-12-01', freq='MS')
+    agenda = pd.DataFrame(programada(*periodicidade(df), datas),
+                          index=df.index, columns=datas)
 
-    input_date = f'{ano}-{mes}-01'
-    input_date = datetime.strptime(input_date, '%Y-%m-%d').date()
+    return df, agenda
 
-    df['pmes_aux'] = df['Periodicidade'].apply(
-        lambda x: x[-1:] if len(x) == 2 else x[-2:])
-    df['pfreq_aux'] = df['Periodicidade'].apply(
-        lambda x: 1 if x[0] == "A" else (2 if x[0] == "B" else 3))
-    df['data_aux'] = df.apply(lambda x: date(
-        int(x['Inicio periodicidade']), int(x['pmes_aux']), 1), axis=1)
-    df['cronograma'] = df.apply(func, axis=1, args=(input_date,))
 
-    df = df[['Nº de Série', 'Periodicidade', 'Classe', 'Inicio periodicidade',
-             'LOCALIZAÇÃO', 'Máquina', 'Modelo', 'Cidade', 'cronograma']]
-    df.rename(columns={'Nº de Série': 'Série'}, inplace=True)
+def cronograma(mes, ano):
+    df, agenda = agenda_preventiva()
+    data = pd.Timestamp(year=ano, month=mes, day=1)
+
+    if data in agenda.columns:
+        df['cronograma'] = agenda[data]
+    else:
+        df['cronograma'] = programada(*periodicidade(df), pd.DatetimeIndex([data]))[:, 0]
 
     return df
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+def meses_preventiva(serie):
+    '''Returns the months, within the selectable years, the machine is due'''
+    df, agenda = agenda_preventiva()
+    devida = agenda.loc[(df['Série'] == serie).to_numpy()].any()
+
+    return list(devida.index[devida.to_numpy()])
+
+
+@versioned()
 def programacao(mes, ano):
 
     def link_g4(row):
@@ -248,7 +979,6 @@ def programacao(mes, ano):
     mes = MONTHS[mes.lower()]
     ano = int(ano)
     df = cronograma(mes, ano)
-    df_hist = hist_handler(load_data("HISTORICO_DATA!A:Y"))
 
     df_horimetro = ultimo_g4_equip('DATA TRABALHO').reset_index()
     df_horimetro.rename(columns={'index': 'Série'}, inplace=True)
@@ -260,67 +990,48 @@ def programacao(mes, ano):
     end_date = pd.to_datetime(f'{ano}-{mes}-{calendar.monthrange(ano, mes)[1]} 23:59:00')
 
     os_mes = load_data('OS Preventivas!C5:H')
-    os_mes['Data'] = pd.to_datetime(os_mes['Data'],
-                                    errors='coerce',
-                                    dayfirst=True)
     os_mes = os_mes.loc[os_mes['Data'] == start_date]
     os_mes = os_mes[['Série', 'Nº OS']]
 
     data = df.merge(os_mes, on='Série', how='left')
 
-    df_hist = df_hist.loc[(df_hist['TIPO DE MANUTENÇÃO'] == 'INSPEÇÃO PREVENTIVA') &
-                          (df_hist['DATA TRABALHO'] >= start_date) &
-                          (df_hist['DATA TRABALHO'] <= end_date)]
-
-    df1 = df_hist.loc[(df_hist['STATUS ATENDIMENTO'] == 'Validado') |
-                      (df_hist['STATUS ATENDIMENTO'] == 'Concluido') |
-                      (df_hist['STATUS ATENDIMENTO'] == 'Cancelado')]
-    df1 = df1[['Nº de Série', 'STATUS ATENDIMENTO', 'CÓDIGO OS APOLLO']]
-    df1.rename(columns={'STATUS ATENDIMENTO': 'atendimentos concluidos', 'Nº de Série': 'Série'}, inplace=True)
-
-    df2 = df_hist[['Nº de Série', 'STATUS ATENDIMENTO', 'CÓDIGO OS APOLLO']]
-    df2.rename(columns={'STATUS ATENDIMENTO': 'atendimentos total', 'Nº de Série': 'Série'}, inplace=True)
-
-    realizados = []
-    for row in data.iterrows():
-        serie = row[1]['Série']
-        os_row = row[1]['Nº OS']
-        concluidos_df = df1.loc[df1['Série'] == serie]
-        atendimentos_df = df2.loc[df2['Série'] == serie]
-        concluidos = len(df1.loc[df1['Série'] == serie])
-        atendimentos = len(df2.loc[df2['Série'] == serie])
-
-        if atendimentos_df['CÓDIGO OS APOLLO'].nunique() > 1:
-            concluidos = len(concluidos_df.loc[concluidos_df['CÓDIGO OS APOLLO'] == os_row])
-            atendimentos = len(atendimentos_df.loc[atendimentos_df['CÓDIGO OS APOLLO'] == os_row])
-            if atendimentos == concluidos:
-                realizados.append(True)
-            else:
-                realizados.append(False)
-        else:
-            if atendimentos == 0:
-                realizados.append(False)
-            else:
-                if atendimentos == concluidos:
-                    realizados.append(True)
-                else:
-                    realizados.append(False)
+    # Sheet order keeps the G4 orders of each OS in history order
+    df_hist = historico_entre('DATA TRABALHO', start_date, end_date, ordenado=False)
+    df_hist = df_hist.loc[df_hist['TIPO DE MANUTENÇÃO'] == 'INSPEÇÃO PREVENTIVA']
 
-    data['Realizado'] = realizados
-    data = data.merge(df_horimetro, on='Série', how='left')
+    concluido = df_hist['STATUS ATENDIMENTO'].isin(['Validado', 'Concluido', 'Cancelado'])
+    series = df_hist['Nº de Série']
+    codigos = df_hist['CÓDIGO OS APOLLO']
+
+    # Attendances and concluded attendances per machine and per machine + OS
+    total = series.value_counts()
+    concluidos = series[concluido].value_counts()
+    codigos_serie = codigos.groupby(series).nunique()
+    total_os = df_hist.groupby([series, codigos]).size()
+    concluidos_os = df_hist[concluido].groupby([series[concluido], codigos[concluido]]).size()
+
+    chave = pd.MultiIndex.from_arrays([data['Série'], data['Nº OS']])
+    atendimentos = data['Série'].map(total).fillna(0).to_numpy()
+    realizados = atendimentos == data['Série'].map(concluidos).fillna(0).to_numpy()
+
+    # A machine with several Apollo OS in the month is judged by its own OS
+    varias_os = data['Série'].map(codigos_serie).fillna(0).to_numpy() > 1
+    realizados_os = (total_os.reindex(chave).fillna(0).to_numpy() ==
+                     concluidos_os.reindex(chave).fillna(0).to_numpy())
 
-    os_g4 = []
-    status = []
-    for row in data.iterrows():
-        os_row = row[1]['Nº OS']
-        df_aux = df_hist.loc[df_hist['CÓDIGO OS APOLLO'] == os_row]
-        df_aux = df_aux[['CÓDIGO OS APOLLO', 'CÓDIGO OS G4', 'STATUS ATENDIMENTO']]
+    data['Realizado'] = np.where(varias_os, realizados_os, realizados & (atendimentos > 0))
+    data = data.merge(df_horimetro, on='Série', how='left')
 
-        os_g4.append(list(df_aux['CÓDIGO OS G4']))
-        status.append(list(df_aux['STATUS ATENDIMENTO']))
+    # G4 orders and their status for each Apollo OS of the month, in history order
+    df_os = historico_de('CÓDIGO OS APOLLO', data['Nº OS'])
+    df_os = df_os.loc[(df_os['TIPO DE MANUTENÇÃO'] == 'INSPEÇÃO PREVENTIVA') &
+                      (df_os['DATA TRABALHO'] >= start_date) &
+                      (df_os['DATA TRABALHO'] <= end_date)]
+    os_g4 = df_os.groupby('CÓDIGO OS APOLLO')[['CÓDIGO OS G4', 'STATUS ATENDIMENTO']].agg(list)
+    os_g4 = os_g4.reindex(data['Nº OS'])
 
-    data['OS G4'] = os_g4
-    data['STATUS G4'] = status
+    data['OS G4'] = [x if isinstance(x, list) else [] for x in os_g4['CÓDIGO OS G4']]
+    data['STATUS G4'] = [x if isinstance(x, list) else [] for x in os_g4['STATUS ATENDIMENTO']]
     data['LINK'] = data['OS G4'].apply(link_g4)
     data['SITUAÇÃO'] = data.apply(situacao, axis=1)
 
@@ -340,9 +1051,5 @@ def programacao(mes, ano):
     return data
 
 
-@st.cache_data(ttl=600, show_spinner=False)
 def ultima_atualizacao():
-    log = load_data('LOG!A:A')
-    data = log.tail(1).values[0][0]
-
-    return data
+    return _version_state['value']
@@ -0,0 +1,374 @@
+'''
+Process-wide registry of parsed sheet tables.
+
+Every range is parsed once per process and kept as a single frame whose
+arrays are marked read-only. Callers receive shallow views of that frame:
+replacing or adding columns on a view only affects the view, while writing
+into the shared arrays raises instead of corrupting what every other
+session sees.
+
+Datasets can also be persisted as Arrow snapshots, so a new process serves
+the last good tables from disk before it ever reaches Google Sheets, and a
+Refresher thread keeps them current off the request path.
+'''
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def freeze(df):
+    '''Marks every array backing the dataframe as read-only'''
+    for block in df._mgr.blocks:
+        values = block.values
+        # Datetime, timedelta and categorical columns wrap a plain ndarray
+        values = getattr(values, '_ndarray', getattr(values, '_codes', values))
+        if hasattr(values, 'flags'):
+            values.flags.writeable = False
+
+    return df
+
+
+class Dataset:
+    '''One parsed table shared by every caller of the process'''
+
+    def __init__(self, frame, **meta):
+        self.frame = freeze(frame)
+        self.meta = meta
+        self.version = None
+        self.loaded_at = time.time()
+        self._sorted = {}
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def age(self):
+        return time.time() - self.loaded_at
+
+    def view(self):
+        '''Zero-copy dataframe over the shared, read-only arrays'''
+        return self.frame.copy(deep=False)
+
+    def sorted_by(self, column):
+        '''
+            Row positions in column order and the sorted non-null keys, built
+            once per dataset. Nulls sort last and are left out of the keys.
+        '''
+        with self._lock:
+            if column not in self._sorted:
+                values = self.frame[column].to_numpy()
+                order = np.argsort(values, kind='stable')
+                keys = values[order]
+                self._sorted[column] = order, keys[:len(keys) - self.frame[column].isna().sum()]
+
+            return self._sorted[column]
+
+    def grouped_by(self, column):
+        '''
+            Distinct values of column, as an index, and the row positions of
+            each one as slices order[bounds[i]:bounds[i + 1]], built once per
+            dataset. Null values are left out.
+        '''
+        with self._lock:
+            if column not in self._groups:
+                codes, uniques = pd.factorize(self.frame[column])
+                order = np.argsort(codes, kind='stable')
+                bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+                self._groups[column] = pd.Index(uniques), order, bounds
+
+            return self._groups[column]
+
+    def lookup(self, column, keys):
+        '''Rows whose column is one of keys, in table order'''
+        index, order, bounds = self.grouped_by(column)
+        codes = index.get_indexer(pd.unique(pd.Series(keys, dtype=object).dropna()))
+        codes = codes[codes >= 0]
+
+        positions = np.concatenate([order[bounds[code]:bounds[code + 1]] for code in codes]
+                                   or [np.empty(0, dtype=np.intp)])
+
+        return self.frame.iloc[np.sort(positions)]
+
+    def window(self, column, start=None, end=None, sort=True):
+        '''
+            Rows with start <= column <= end, found by binary search on the
+            sorted keys. They come in column order, or in table order when
+            sort is False.
+        '''
+        order, keys = self.sorted_by(column)
+        low = 0 if start is None else keys.searchsorted(np.datetime64(start), 'left')
+        high = len(keys) if end is None else keys.searchsorted(np.datetime64(end), 'right')
+
+        positions = order[low:high]
+        if not sort:
+            positions = np.sort(positions)
+
+        return self.frame.iloc[positions]
+
+
+class SnapshotStore:
+    '''Arrow IPC snapshots of the datasets, one file per key'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, quote(key, safe='') + '.arrow')
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, dataset):
+        table = pa.Table.from_pandas(dataset.frame, preserve_index=False)
+        saved = json.dumps({'version': dataset.version, 'meta': dataset.meta})
+        table = table.replace_schema_metadata({**table.schema.metadata,
+                                               b'dataset': saved.encode()})
+
+        # Written to a file of its own and renamed, so readers never see a
+        # partial file and two saves of the same key never share one
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as file:
+            temporary = file.name
+        try:
+            with pa.OSFile(temporary, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def load(self, key):
+        '''
+            Reads the snapshot of key, or returns None when there is none.
+            Each Arrow column is released once converted, so the table and
+            the frame are not both held whole.
+        '''
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with pa.OSFile(path, 'rb') as source:
+                table = pa.ipc.open_file(source).read_all()
+            saved = json.loads(table.schema.metadata[b'dataset'])
+        except (OSError, KeyError, ValueError, pa.ArrowException) as error:
+            print(f'Snapshot {key}: {error}')
+            return None
+
+        dataset = Dataset(table.to_pandas(split_blocks=True, self_destruct=True), **saved['meta'])
+        del table
+        dataset.version = saved['version']
+
+        return dataset
+
+
+class Flight:
+    '''Lock of the loads of one key, and the last failure of its loader'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failed_at = None
+        self.error = None
+
+    def fail(self, error):
+        self.failed_at = time.monotonic()
+        self.error = error
+
+    def cooling(self, cooldown):
+        '''Whether the loader failed less than cooldown seconds ago'''
+        return self.failed_at is not None and time.monotonic() - self.failed_at < cooldown
+
+
+class Registry:
+    '''
+        Holds one Dataset per key. Datasets are stamped with the data version
+        they were loaded under and go stale once the registry version changes.
+        While the version is still unknown, whatever is loaded is served.
+
+        With a store, every loaded dataset is persisted in the background and
+        keys missing from memory are restored from their last snapshot.
+
+        Loads are single-flight: concurrent misses on one key run the loader
+        once and the other callers wait for its result. A failed load is
+        shared the same way: for cooldown seconds, callers get the stale
+        dataset or the same error instead of running the loader again.
+        coalesced counts the loads avoided.
+
+        generation counts the changes to the tables already served: a new
+        version, edited tables under the same one, a replaced dataset or a
+        clear. Caches derived from the tables are keyed on it.
+    '''
+
+    def __init__(self, store=None, cooldown=10):
+        self.version = None
+        self.generation = 0
+        self.store = store
+        self.cooldown = cooldown
+        self.coalesced = 0
+        self._datasets = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def peek(self, key):
+        with self._lock:
+            dataset = self._datasets.get(key)
+
+        if dataset is None and self.store is not None:
+            dataset = self.store.load(key)
+            if dataset is not None:
+                with self._lock:
+                    dataset = self._datasets.setdefault(key, dataset)
+
+        return dataset
+
+    def keys(self):
+        with self._lock:
+            return list(self._datasets)
+
+    def is_fresh(self, key, version=None):
+        '''Whether key is loaded under version, the registry version by default'''
+        dataset = self.peek(key)
+        return dataset is not None and self._matches(dataset, version)
+
+    def _matches(self, dataset, version=None):
+        if version is None:
+            version = self.version
+        return version is None or dataset.version == version
+
+    def put(self, key, dataset, version):
+        dataset.version = version
+        with self._lock:
+            if key in self._datasets:
+                self.generation += 1
+            self._datasets[key] = dataset
+
+        self._persist_later(key, dataset)
+
+        return dataset
+
+    def publish(self, version, datasets, edited=False):
+        '''
+            Swaps in the datasets loaded under version and makes it the
+            registry version in one step, so no reader sees a mix of both
+            versions. edited tells that the datasets differ from the ones
+            held even if the version did not change. Returns True when the
+            version changed.
+        '''
+        with self._lock:
+            for key, dataset in datasets.items():
+                dataset.version = version
+                self._datasets[key] = dataset
+            changed = version != self.version
+            self.version = version
+            if changed or edited:
+                self.generation += 1
+
+        for key, dataset in datasets.items():
+            self._persist_later(key, dataset)
+
+        return changed
+
+    def _persist_later(self, key, dataset):
+        if self.store is not None:
+            threading.Thread(target=self._persist, args=(key, dataset),
+                             daemon=True).start()
+
+    def _persist(self, key, dataset):
+        try:
+            self.store.save(key, dataset)
+        except (OSError, pa.ArrowException) as error:
+            print(f'Snapshot {key}: {error}')
+
+    def count_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def get(self, key, loader):
+        '''
+            Returns a view of the dataset, calling loader() when it is missing
+            or stale. loader returns the new Dataset, or None on failure, in
+            which case a stale dataset is still served.
+        '''
+        dataset = self.peek(key)
+        if dataset is not None and self._matches(dataset):
+            return dataset.view()
+
+        with self._lock:
+            flight = self._flights.setdefault(key, Flight())
+
+        with flight.lock:
+            # Whoever held the flight may have loaded it while we waited
+            version = self.version
+            dataset = self.peek(key)
+            if dataset is not None and self._matches(dataset):
+                self.count_coalesced()
+                return dataset.view()
+
+            if flight.cooling(self.cooldown):
+                self.count_coalesced()
+                return self._fallback(key, dataset, flight.error)
+
+            try:
+                loaded = loader()
+            except Exception as error:
+                flight.fail(error)
+                return self._fallback(key, dataset, error)
+
+            if loaded is None:
+                flight.fail(None)
+                return self._fallback(key, dataset, None)
+
+            flight.failed_at = None
+            dataset = self.put(key, loaded, version)
+
+        return dataset.view()
+
+    def _fallback(self, key, dataset, error):
+        '''A failed reload keeps serving the last good dataset, or raises error'''
+        if dataset is None:
+            if error is not None:
+                raise error
+            return None
+
+        print(f'{key}: reload failed, serving version {dataset.version}')
+        return dataset.view()
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+            self.generation += 1
+
+
+class Refresher:
+    '''
+        Daemon thread running job() every interval seconds, starting right
+        away. Failures are logged and retried on the next round.
+    '''
+
+    def __init__(self, job, interval):
+        self.job = job
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''Starts the thread once per process, no-op when it is running'''
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='refresher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.job()
+            except Exception as error:
+                print(f'Refresher: {error}')
+
+            time.sleep(self.interval)
@@ -1,39 +1,27 @@
-import plotly.graph_objects as go
 import streamlit as st
-import streamlit_authenticator as stauth
-import yaml
-from plotly.subplots import make_subplots
-from yaml.loader import SafeLoader
 
-from config import calcula_data, hist_handler, load_data, ultimo_g4_equip
+from bootstrap import barra_lateral, iniciar
+from cache import versioned
+from ui import abas, painel, tabela_paginada
 
-st.set_page_config(page_title="Gestão de Frotas",
-                   page_icon="🛠",
-                   layout='wide')
+RANGES = [
+    'Lista de Equipamentos!A:AY',
+    'HISTORICO_DATA!A:Y',
+]
 
-
-with open('./config.yaml') as file:
-    configuration = yaml.load(file, Loader=SafeLoader)
-
-authenticator = stauth.Authenticate(
-    configuration['credentials'],
-    configuration['cookie']['name'],
-    configuration['cookie']['key'],
-    configuration['cookie']['expiry_days'],
-    configuration['pre-authorized']
-)
+authenticator = iniciar()
 
 
 def link_g4(row):
     return 'http://g4.transpotech.com.br/transpotech/os/detalhar/' + str(row['CÓDIGO OS G4'][:row['CÓDIGO OS G4'].index('-')])
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned(ttl=600)
 def ultimos_atendimentos(filtro):
-    historico_data = hist_handler(load_data('HISTORICO_DATA!A:Y'))
     data_filtro = calcula_data(filtro)
 
-    historico_data = historico_data.loc[historico_data['DATA ABERTURA OS'] >= data_filtro].sort_values(by='DATA ABERTURA OS', ascending=False)
+    # Newest first, straight from the sorted index
+    historico_data = historico_entre('DATA ABERTURA OS', data_filtro).iloc[::-1]
     historico_data['Link G4'] = historico_data.apply(link_g4, axis=1)
 
     historico_data['DATA ABERTURA OS'] = historico_data['DATA ABERTURA OS'].dt.strftime('%d/%m/%Y %H:%M')
@@ -44,14 +32,32 @@ def ultimos_atendimentos(filtro):
     return historico_data
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
+def status_frota():
+    df = ultimo_g4_equip('DATA TRABALHO')
+    df['Link G4'] = df.apply(link_g4, axis=1)
+
+    # Status of each active machine looked up by serial, df has one row per serial
+    ativos = load_data('Lista de Equipamentos!A:AY')
+    ativos = ativos.loc[(ativos['Status'] == 'ATIVO') & ativos['Nº de Série'].isin(df.index)]
+    status = df['STATUS DO EQUIPAMENTO'].reindex(ativos['Nº de Série']).set_axis(ativos.index)
+
+    # crosstab lists every category of the categoricals, even those with no machine
+    por_cliente = pd.crosstab(ativos['LOCALIZAÇÃO'], status, dropna=True)
+    por_cliente = por_cliente.loc[por_cliente.sum(axis=1) > 0, por_cliente.sum(axis=0) > 0]
+
+    return StatusFrota(ultimos=df,
+                       contagem=df['STATUS DO EQUIPAMENTO'].value_counts().to_dict(),
+                       por_cliente=por_cliente,
+                       por_status=dict(tuple(df.groupby('STATUS DO EQUIPAMENTO', sort=False, observed=True))),
+                       pendencias=df.loc[df['PENDÊNCIA'] == 'Sim'])
+
+
+@versioned(ttl=600)
 def vias_parar(filtro):
-    result = ultimo_g4_equip('DATA TRABALHO')
+    result = status_frota().linhas('Equipamento em vias de parar')
     data_filtro = calcula_data(filtro)
 
-    result['Link G4'] = result.apply(link_g4, axis=1)
-
-    result = result.loc[result['STATUS DO EQUIPAMENTO'] == 'Equipamento em vias de parar']
     result = result[['FROTA', 'RAZÃO SOCIAL', 'DATA TRABALHO', 'Link G4']]
     result = result.loc[result['DATA TRABALHO'] >= data_filtro]
     result = result.sort_values(by='DATA TRABALHO', ascending=True)
@@ -60,14 +66,11 @@ def vias_parar(filtro):
     return result
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned(ttl=600)
 def parados(filtro):
-    result = ultimo_g4_equip('DATA TRABALHO')
+    result = status_frota().linhas('Equipamento parado', 'Equipamento parado com risco de acidente')
     data_filtro = calcula_data(filtro)
 
-    result['Link G4'] = result.apply(link_g4, axis=1)
-
-    result = result.loc[(result['STATUS DO EQUIPAMENTO'] == 'Equipamento parado') | (result['STATUS DO EQUIPAMENTO'] == 'Equipamento parado com risco de acidente')]
     result = result[['FROTA', 'RAZÃO SOCIAL', 'DATA TRABALHO', 'Link G4', 'STATUS DO EQUIPAMENTO']]
     result = result.loc[result['DATA TRABALHO'] >= data_filtro]
     result = result.sort_values(by='DATA TRABALHO', ascending=True)
@@ -76,14 +79,11 @@ def parados(filtro):
     return result
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned(ttl=600)
 def pendencias(filtro):
-    result = ultimo_g4_equip('DATA TRABALHO')
+    result = status_frota().pendencias
     data_filtro = calcula_data(filtro)
 
-    result['Link G4'] = result.apply(link_g4, axis=1)
-
-    result = result.loc[result['PENDÊNCIA'] == 'Sim']
     result = result[['FROTA', 'RAZÃO SOCIAL', 'DATA TRABALHO', 'Link G4', 'COMENTÁRIO DO TÉCNICO', 'STATUS DO EQUIPAMENTO']]
     result = result.loc[result['DATA TRABALHO'] >= data_filtro]
     result = result.sort_values(by='DATA TRABALHO', ascending=True)
@@ -92,46 +92,23 @@ def pendencias(filtro):
     return result
 
 
-@st.cache_data(ttl=600, show_spinner=False)
-def metrics(status):
-    df = ultimo_g4_equip('DATA TRABALHO')
-    df = df.loc[df['STATUS DO EQUIPAMENTO'] == status]
-
-    return len(df)
-
-
-@st.cache_data(ttl=600, show_spinner=False)
+@versioned()
 def bar_pizza_subplot():
-    df = ultimo_g4_equip('DATA TRABALHO')
-
-    ativos = load_data('Lista de Equipamentos!A:AY')
-    ativos = ativos.loc[ativos['Status'] == 'ATIVO']
-    ativos = ativos[['Nº de Série', 'LOCALIZAÇÃO']]
-    ativos = ativos.rename(columns={'Nº de Série': 'SÉRIE'})
-
-    df_bar = df.reset_index(names='SÉRIE')
-    df_bar = df_bar.drop('Nº de Série', axis=1)
-
-    df_bar = df_bar.merge(ativos, on='SÉRIE')
-
-    x = list(set(list(df_bar['LOCALIZAÇÃO'])))
-
-    operando_lista = []
-    parado_lista = []
-
-    for cliente in x:
-        df_aux = df_bar.loc[df_bar['LOCALIZAÇÃO'] == cliente]
-        operando = len(df_aux.loc[(df_bar['STATUS DO EQUIPAMENTO'] == 'Equipamento operando') |
-                                  (df_bar['STATUS DO EQUIPAMENTO'] == 'Equipamento em vias de parar')])
-        parado = len(df_aux.loc[(df_bar['STATUS DO EQUIPAMENTO'] == 'Equipamento parado') |
-                                (df_bar['STATUS DO EQUIPAMENTO'] == 'Equipamento parado com risco de acidente')])
-        operando_lista.append(operando)
-        parado_lista.append(parado)
-
-    operando = len(df.loc[df['STATUS DO EQUIPAMENTO'] == 'Equipamento operando'])
-    vias_de_parar = len(df.loc[df['STATUS DO EQUIPAMENTO'] == 'Equipamento em vias de parar'])
-    parado = len(df.loc[df['STATUS DO EQUIPAMENTO'] == 'Equipamento parado'])
-    parado_risco = len(df.loc[df['STATUS DO EQUIPAMENTO'] == 'Equipamento parado com risco de acidente'])
+    frota = status_frota()
+
+    por_cliente = frota.por_cliente.reindex(columns=['Equipamento operando',
+                                                     'Equipamento em vias de parar',
+                                                     'Equipamento parado',
+                                                     'Equipamento parado com risco de acidente'],
+                                            fill_value=0)
+    x = list(por_cliente.index)
+    operando_lista = list(por_cliente.iloc[:, 0] + por_cliente.iloc[:, 1])
+    parado_lista = list(por_cliente.iloc[:, 2] + por_cliente.iloc[:, 3])
+
+    operando = frota.quantidade('Equipamento operando')
+    vias_de_parar = frota.quantidade('Equipamento em vias de parar')
+    parado = frota.quantidade('Equipamento parado')
+    parado_risco = frota.quantidade('Equipamento parado com risco de acidente')
 
     labels = ['Equipamento operando', 'Equipamento em vias de parar', 'Equipamento parado', 'Equipamento parado com risco de acidente']
     values = [operando, vias_de_parar, parado, parado_risco]
@@ -167,138 +144,122 @@ def bar_pizza_subplot():
     return fig
 
 
-with open('style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+@painel
+def indicadores():
+    frota = status_frota()
+    r1, r2, r3, r4 = st.columns(4)
+
+    with r1:
+        r1a1, r1a2 = st.columns(spec=[2, 8])
+        with r1a1:
+            st.header('✅')
+        with r1a2:
+            st.metric('Equipamentos Operando', frota.quantidade('Equipamento operando'))
+    with r2:
+        r1b1, r1b2 = st.columns(spec=[2, 8])
+        with r1b1:
+            st.header('⚠️')
+        with r1b2:
+            st.metric('Equipamentos em vias de parar', frota.quantidade('Equipamento em vias de parar'))
+    with r3:
+        r1c1, r1c2 = st.columns(spec=[2, 8])
+        with r1c1:
+            st.header('🚨')
+        with r1c2:
+            st.metric('Equipamentos parados ', frota.quantidade('Equipamento parado'))
+    with r4:
+        r1d1, r1d2 = st.columns(spec=[2, 8])
+        with r1d1:
+            st.header('☠️')
+        with r1d2:
+            st.metric('Equipamentos parados com risco de acidente ', frota.quantidade('Equipamento parado com risco de acidente'))
+    st.subheader('Disponibilidade')
+
+    st.plotly_chart(bar_pizza_subplot(), use_container_width=True, theme='streamlit')
+
+
+@painel
+def dados():
+    a1, a2 = st.columns([5, 1.5])
+    with a1:
+        st.subheader("Ultimos Atendimentos")
+    with a2:
+        dias = st.radio(label="Dias",
+                        options=[1, 7, 30, 90],
+                        horizontal=True)
+    link_g4_config = {
+        'Link G4': st.column_config.LinkColumn(
+            'Abrir OS',
+            display_text='Abrir OS'
+        )
+    }
+
+    df_ultimos_atendimentos = ultimos_atendimentos(int(dias))
+    tabela_paginada(
+        df_ultimos_atendimentos,
+        key='ultimos_atendimentos',
+        column_config=link_g4_config,
+        height=300,
+        use_container_width=True,
+    )
+
+    pendencia_df = pendencias(dias)
+    st.subheader("Pendências")
+    tabela_paginada(
+            pendencia_df,
+            key='pendencias',
+            column_config=link_g4_config,
+            height=300,
+            use_container_width=True,
+        )
+
+    b1, b2 = st.columns(2)
+    with b1:
+        df_vias_parar = vias_parar(int(dias))
+        st.subheader("Equipamentos em vias de parar")
+        tabela_paginada(
+            df_vias_parar,
+            key='vias_parar',
+            column_config=link_g4_config,
+            height=300,
+            use_container_width=True,
+        )
+    with b2:
+        df_parados = parados(int(dias))
+        st.subheader("Equipamentos Parados")
+        tabela_paginada(
+            df_parados,
+            key='parados',
+            column_config=link_g4_config,
+            height=300,
+            use_container_width=True,
+        )
 
-authenticator.login(fields={'Form name': 'Dashboard Joinville',
-                            'Username': 'Usuário',
-                            'Password': 'Senha'})
 
 if st.session_state['authentication_status']:
+    # Heavy imports wait for the login, the form renders without them
+    import pandas as pd
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    from config import (StatusFrota, calcula_data, clear_caches,
+                        historico_entre, load_data, refresh, ultimo_g4_equip)
+
     try:
-        with st.sidebar:
-            st.image('img/logo_new.png', use_column_width='auto')
-            st.page_link('Home.py', label='Home', icon='🏠')
-            st.page_link('pages/Corretiva.py', label='Corretiva', icon='🔩')
-            st.page_link('pages/Preventiva.py', label='Preventiva', icon='📆')
-
-            st.divider()
-
-            if st.button('Recarregar', type='primary'):
-                st.cache_data.clear()
-
-            st.divider()
-
-            authenticator.logout(button_name='Sair')
-
-        indicadores, dados = st.tabs(["📈 Indicadores", "🗃 Dados"])
-
-        with indicadores:
-            r1, r2, r3, r4 = st.columns(4)
-
-            with r1:
-                r1a1, r1a2 = st.columns(spec=[2, 8])
-                with r1a1:
-                    st.header('✅')
-                with r1a2:
-                    st.metric('Equipamentos Operando', metrics('Equipamento operando'))
-            with r2:
-                r1b1, r1b2 = st.columns(spec=[2, 8])
-                with r1b1:
-                    st.header('⚠️')
-                with r1b2:
-                    st.metric('Equipamentos em vias de parar', metrics('Equipamento em vias de parar'))
-            with r3:
-                r1c1, r1c2 = st.columns(spec=[2, 8])
-                with r1c1:
-                    st.header('🚨')
-                with r1c2:
-                    st.metric('Equipamentos parados ', metrics('Equipamento parado'))
-            with r4:
-                r1d1, r1d2 = st.columns(spec=[2, 8])
-                with r1d1:
-                    st.header('☠️')
-                with r1d2:
-                    st.metric('Equipamentos parados com risco de acidente ', metrics('Equipamento parado com risco de acidente'))
-            st.subheader('Disponibilidade')
-
-            st.plotly_chart(bar_pizza_subplot(), use_container_width=True, theme='streamlit')
-
-        with dados:
-            a1, a2 = st.columns([5, 1.5])
-            with a1:
-                st.subheader("Ultimos Atendimentos")
-            with a2:
-                dias = st.radio(label="Dias",
-                                options=[1, 7, 30, 90],
-                                horizontal=True)
-            df_ultimos_atendimentos = ultimos_atendimentos(int(dias))
-            st.data_editor(
-                df_ultimos_atendimentos,
-                column_config={
-                    'Link G4': st.column_config.LinkColumn(
-                        "Abrir OS",
-                        display_text='Abrir OS'
-                    )
-                },
-                hide_index=True,
-                height=300,
-                disabled=True,
-                use_container_width=True,
-            )
-
-            pendencia_df = pendencias(dias)
-            st.subheader("Pendências")
-            st.data_editor(
-                    pendencia_df,
-                    column_config={
-                        'Link G4': st.column_config.LinkColumn(
-                            'Abrir OS',
-                            display_text='Abrir OS'
-                        )
-                    },
-                    hide_index=True,
-                    height=300,
-                    disabled=True,
-                    use_container_width=True,
-                )
-
-            b1, b2 = st.columns(2)
-            with b1:
-                df_vias_parar = vias_parar(int(dias))
-                st.subheader("Equipamentos em vias de parar")
-                st.data_editor(
-                    df_vias_parar,
-                    column_config={
-                        'Link G4': st.column_config.LinkColumn(
-                            'Abrir OS',
-                            display_text='Abrir OS'
-                        )
-                    },
-                    hide_index=True,
-                    height=300,
-                    disabled=True,
-                    use_container_width=True,
-                )
-            with b2:
-                df_parados = parados(int(dias))
-                st.subheader("Equipamentos Parados")
-                st.data_editor(
-                    df_parados,
-                    column_config={
-                        'Link G4': st.column_config.LinkColumn(
-                            'Abrir OS',
-                            display_text='Abrir OS'
-                        )
-                    },
-                    hide_index=True,
-                    height=300,
-                    disabled=True,
-                    use_container_width=True,
-                )
+        refresh(RANGES)
+
+        barra_lateral(authenticator, RANGES)
+
+        aba = abas(["📈 Indicadores", "🗃 Dados"], key='corretiva_aba')
+
+        if aba == "📈 Indicadores":
+            indicadores()
+        else:
+            dados()
+
     except TimeoutError:
         st.toast('Carregando. Por favor aguarde')
-        st.cache_data.clear()
+        clear_caches()
 
     except Exception as e:
         st.write('Favor contate o administrador')
@@ -0,0 +1,130 @@
+'''
+Long-lived Google Sheets client shared by every session of the process.
+
+The service is built from the discovery document bundled with
+googleapiclient, so building it makes no HTTP call. Requests run over a
+small pool of keep-alive connections: httplib2 connections are not
+thread-safe, so each request checks one out and returns it afterwards,
+and the next request reuses its TLS session instead of opening a new one.
+Connections time out like googleapiclient's own transport, so a hung
+socket fails its request instead of holding the caller forever, and a
+connection whose request failed is closed rather than pooled.
+
+Every request first takes a token from a TokenBucket sized to the Sheets
+read quota, and backoff() spaces out the retries of throttled requests.
+
+The OAuth token is refreshed ahead of its expiry by refresh_token(), meant
+to be called from a background thread, so no request waits on it.
+'''
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+# Statuses worth retrying, the rest fail the same way on every attempt
+RETRYABLE = {408, 429, 500, 502, 503, 504}
+
+
+def backoff(error, attempt, base=2.0, cap=32.0):
+    '''
+        Seconds to wait before retrying a failed request, or None when the
+        error will not go away. Honours Retry-After, otherwise waits a full
+        jitter exponential delay.
+    '''
+    if error.resp.status not in RETRYABLE:
+        return None
+
+    try:
+        return float(error.resp['retry-after'])
+    except (KeyError, ValueError):
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    '''
+        Allows rate requests per second on average, in bursts of up to
+        capacity. acquire() blocks until the caller's token is due.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            # Tokens are reserved up front, so waiters are served in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+class SheetsClient:
+    '''Sheets v4 service over a pool of authorized keep-alive connections'''
+
+    def __init__(self, credentials, token_path=None, limiter=None, pool_size=4, refresh_margin=300):
+        self.credentials = credentials
+        self.token_path = token_path
+        self.limiter = limiter
+        self.refresh_margin = refresh_margin
+        self.service = build('sheets', 'v4', credentials=credentials,
+                             static_discovery=True, cache_discovery=False)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._token_lock = threading.Lock()
+
+    def values(self):
+        return self.service.spreadsheets().values()
+
+    @contextmanager
+    def connection(self):
+        '''Checks a connection out of the pool, opening one when it is empty'''
+        try:
+            http = self._pool.get_nowait()
+        except queue.Empty:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=build_http())
+
+        try:
+            yield http
+        except BaseException:
+            http.close()
+            raise
+
+        try:
+            self._pool.put_nowait(http)
+        except queue.Full:
+            http.close()
+
+    def execute(self, request):
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+        with self.connection() as http:
+            return request.execute(http=http)
+
+    def refresh_token(self):
+        '''Refreshes the token once it gets within refresh_margin seconds of expiring'''
+        with self._token_lock:
+            expiry = self.credentials.expiry
+            margin = timedelta(seconds=self.refresh_margin)
+            if expiry is not None and datetime.now(timezone.utc).replace(tzinfo=None) + margin < expiry:
+                return
+
+            self.credentials.refresh(Request())
+            if self.token_path is not None:
+                with open(self.token_path, 'w') as token:
+                    token.write(self.credentials.to_json())
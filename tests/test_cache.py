@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+import config
+from cache import drop_old_generations, versioned
+from datasets import Dataset, Registry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry()
+    registry.put('key', Dataset(pd.DataFrame({'a': [1, 2]})), '1:antes')
+    registry.version = '1:antes'
+    monkeypatch.setattr(config, 'registry', registry)
+
+    yield registry
+    drop_old_generations()
+
+
+def test_result_finished_after_a_publish_is_not_served(registry):
+    calls = []
+
+    @versioned()
+    def total():
+        soma = int(registry.peek('key').frame['a'].sum())
+        # The refresher publishes while this run still holds the old tables
+        if not calls:
+            registry.publish('2:depois', {'key': Dataset(pd.DataFrame({'a': [1, 2, 3]}))})
+        calls.append(soma)
+        return soma
+
+    assert total() == 3
+    assert total() == 6
+    assert total() == 6
+    assert calls == [3, 6]
+
+
+def test_edited_tables_under_the_same_version_move_the_generation(registry):
+    generation = registry.generation
+
+    registry.publish('1:antes', {'key': Dataset(pd.DataFrame({'a': [1, 2]}))})
+    assert registry.generation == generation
+
+    registry.publish('1:antes', {'key': Dataset(pd.DataFrame({'a': [1, 5]}))}, edited=True)
+    assert registry.generation == generation + 1
+
+    registry.put('key', Dataset(pd.DataFrame({'a': [7]})), '1:antes')
+    assert registry.generation == generation + 2
+
+
+def test_arguments_and_functions_keep_their_own_entries(registry):
+    @versioned()
+    def dobro(x):
+        return 2 * x
+
+    @versioned()
+    def triplo(x):
+        return 3 * x
+
+    assert [dobro(1), dobro(2), triplo(1), triplo(2)] == [2, 4, 3, 6]
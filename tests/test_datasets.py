@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from datasets import Dataset, Registry, SnapshotStore
+
+
+class FailingLoader:
+    '''Loader that blocks until released, then raises, counting its calls'''
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        raise ConnectionError('sheets down')
+
+
+def concurrent_gets(registry, loader):
+    '''Runs two gets of one key, the second one waiting on the first one's flight'''
+    results = []
+
+    def get():
+        try:
+            results.append(registry.get('key', loader))
+        except ConnectionError as error:
+            results.append(error)
+
+    first = threading.Thread(target=get)
+    first.start()
+    loader.started.wait(5)
+
+    second = threading.Thread(target=get)
+    second.start()
+    # Let the second caller block on the flight before the load fails
+    time.sleep(0.1)
+    loader.release.set()
+
+    first.join(5)
+    second.join(5)
+
+    return results
+
+
+def test_failure_without_stale_dataset_is_shared():
+    registry = Registry()
+    loader = FailingLoader()
+
+    results = concurrent_gets(registry, loader)
+
+    assert loader.calls == 1
+    assert len(results) == 2
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert registry.coalesced == 1
+
+
+def test_failure_serves_the_stale_dataset_to_every_waiter():
+    registry = Registry()
+    registry.put('key', Dataset(pd.DataFrame({'a': [1, 2]})), 'v1')
+    registry.version = 'v2'
+    loader = FailingLoader()
+
+    results = concurrent_gets(registry, loader)
+
+    assert loader.calls == 1
+    assert [result['a'].tolist() for result in results] == [[1, 2], [1, 2]]
+
+
+def test_loader_runs_again_after_the_cooldown():
+    registry = Registry(cooldown=0)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None
+
+    assert registry.get('key', loader) is None
+    assert registry.get('key', loader) is None
+    assert len(calls) == 2
+
+
+def test_failure_within_the_cooldown_is_not_retried():
+    registry = Registry(cooldown=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        raise ConnectionError('sheets down')
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            registry.get('key', loader)
+    assert len(calls) == 1
+
+
+def test_snapshot_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    frame = pd.DataFrame({'a': [1.5, None], 'b': pd.Categorical(['x', 'y']),
+                          'c': pd.to_datetime(['2024-01-01', None])})
+    dataset = Dataset(frame, last_row=['x', 'y'])
+    dataset.version = '3:abc'
+
+    store.save('TESTE!A:C', dataset)
+    loaded = store.load('TESTE!A:C')
+
+    pd.testing.assert_frame_equal(loaded.frame, frame)
+    assert loaded.version == '3:abc'
+    assert loaded.meta == {'last_row': ['x', 'y']}
+
+
+def test_concurrent_saves_of_a_key_do_not_share_a_file(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    datasets = [Dataset(pd.DataFrame({'a': range(i, i + 50_000)})) for i in range(8)]
+    errors = []
+
+    def save(dataset):
+        try:
+            store.save('key', dataset)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=save, args=(dataset,)) for dataset in datasets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == []
+    assert os.listdir(tmp_path) == [os.path.basename(store.path('key'))]
+    first = store.load('key').frame['a'].iloc[0]
+    assert store.load('key').frame['a'].tolist() == list(range(first, first + 50_000))
@@ -0,0 +1,519 @@
+'''
+The vectorized table builder, typed schemas, history indexes and schedule
+against the implementations they replaced, on small fixed payloads. The
+legacy_* functions are the baseline code with load_data taken out: they get
+the frames it used to return.
+'''
+import calendar
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import config
+from datasets import Registry
+
+HISTORICO = 'HISTORICO_DATA!A:Y'
+LISTA = 'Lista de Equipamentos!A:AY'
+OS_PREVENTIVAS = 'OS Preventivas!C5:H'
+
+# The baseline concatenates onto an empty frame
+pytestmark = pytest.mark.filterwarnings('ignore:The behavior of DataFrame concatenation:FutureWarning')
+
+HISTORICO_HEADER = ['CÓDIGO OS G4', 'Nº de Série', 'DATA ABERTURA OS', 'DATA TRABALHO',
+                    'DURAÇÃO IDA', 'DURAÇÃO TRABALHO', 'DURAÇÃO VOLTA', 'HORÍMETRO',
+                    'STATUS DO EQUIPAMENTO', 'TIPO DE MANUTENÇÃO', 'STATUS ATENDIMENTO',
+                    'CÓDIGO OS APOLLO', 'RAZÃO SOCIAL']
+
+IDA, TRABALHO, VOLTA = timedelta(minutes=30), timedelta(hours=1, minutes=15), timedelta(minutes=40)
+PREVENTIVA = 'INSPEÇÃO PREVENTIVA'
+
+HISTORICO_ROWS = [
+    ('1001-1', '001234', datetime(2024, 2, 27, 8), datetime(2024, 3, 4, 9, 30), IDA, TRABALHO, VOLTA,
+     1200.5, 'Equipamento operando', PREVENTIVA, 'Validado', 'AP-1', 'CLIENTE A'),
+    ('1002-1', '001234', datetime(2024, 3, 10, 8), datetime(2024, 3, 12, 14), IDA, TRABALHO, VOLTA,
+     1210.25, 'Equipamento em vias de parar', 'CORRETIVA', 'Concluido', None, 'CLIENTE A'),
+    ('1003-1', '5678', datetime(2024, 3, 1, 7), datetime(2024, 3, 5, 10), IDA, None, VOLTA,
+     880.0, 'Equipamento parado', PREVENTIVA, 'Pendente', 'AP-2', 'CLIENTE B'),
+    ('1004-1', '5678', datetime(2024, 3, 1, 7), datetime(2024, 3, 20, 11), IDA, TRABALHO, VOLTA,
+     12345.6, 'Equipamento operando', PREVENTIVA, 'Concluido', 'AP-2', 'CLIENTE B'),
+    # No work date: NaT sorts last, so it is the machine's latest attendance
+    ('1005-1', '9012', datetime(2024, 3, 2), None, IDA, TRABALHO, VOLTA,
+     None, 'Equipamento operando', PREVENTIVA, 'Validado', 'AP-3', 'CLIENTE C'),
+    ('1006-1', '9012', datetime(2024, 3, 3), 'sem data', IDA, TRABALHO, VOLTA,
+     450.0, None, 'CORRETIVA', 'Validado', None, 'CLIENTE C'),
+    # Two Apollo orders for one machine in the month
+    ('1007-1', '3456', datetime(2024, 3, 5), datetime(2024, 3, 8, 9), IDA, TRABALHO, VOLTA,
+     300.75, 'Equipamento operando', PREVENTIVA, 'Validado', 'AP-4', 'CLIENTE A'),
+    ('1008-1', '3456', datetime(2024, 3, 6), datetime(2024, 3, 9, 9), IDA, TRABALHO, VOLTA,
+     301.0, 'Equipamento operando', PREVENTIVA, 'Pendente', 'AP-5', 'CLIENTE A'),
+    ('1009-1', '7777', datetime(2023, 11, 1), datetime(2023, 11, 2, 9), IDA, TRABALHO, VOLTA,
+     50.0, 'Equipamento parado com risco de acidente', PREVENTIVA, 'Validado', 'AP-0', 'CLIENTE D'),
+    # Blank row, dropped by the tolerance
+    (None,) * 13,
+    # Short row, the sheet leaves its trailing blank cells out
+    ('1010-1', '001234', datetime(2024, 1, 15), datetime(2024, 1, 16, 8), IDA, TRABALHO, VOLTA,
+     1150.0, 'Equipamento operando', 'CORRETIVA', 'Validado', None, None),
+]
+
+LISTA_HEADER = ['Nº de Série', 'Status', 'Periodicidade', 'Classe', 'Inicio periodicidade',
+                'LOCALIZAÇÃO', 'Máquina', 'Modelo', 'Cidade']
+
+LISTA_ROWS = [
+    ('001234', 'ATIVO', 'A1', 'I', '2022', 'CLIENTE A', 'F-01', 'M1', 'Joinville'),
+    ('5678', 'ATIVO', 'B3', 'II', '2023', 'CLIENTE B', 'F-02', 'M2', 'Joinville'),
+    ('9012', 'ATIVO', 'C12', 'I', '2023', 'CLIENTE C', 'F-03', 'M1', 'Blumenau'),
+    ('3456', 'ATIVO', 'B2', 'III', '2024', 'CLIENTE A', 'F-04', 'M3', 'Joinville'),
+    # Active without any attendance in the history
+    ('2468', 'ATIVO', 'C3', 'II', '2022', 'CLIENTE E', 'F-05', 'M2', 'Itajaí'),
+    ('7777', 'INATIVO', 'A1', 'I', '2022', 'CLIENTE D', 'F-06', 'M1', 'Joinville'),
+]
+
+OS_HEADER = ['Série', 'Data', 'Nº OS']
+
+OS_ROWS = [
+    ('001234', date(2024, 3, 1), 'AP-1'),
+    ('5678', date(2024, 3, 1), 'AP-2'),
+    ('9012', date(2024, 3, 1), 'AP-3'),
+    ('3456', date(2024, 3, 1), 'AP-4'),
+    # Apollo order missing from the history
+    ('2468', date(2024, 3, 1), 'AP-9'),
+    ('001234', date(2024, 2, 1), 'AP-8'),
+]
+
+EPOCH = datetime(1899, 12, 30)
+
+
+def formatted(value):
+    '''The cell as Sheets shows it'''
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        return f'{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+    return str(value)
+
+
+def unformatted(value):
+    '''The cell as UNFORMATTED_VALUE returns it, dates and durations as day serials'''
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return (value - EPOCH).total_seconds() / 86400
+    if isinstance(value, date):
+        return (value - EPOCH.date()).days
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 86400
+    return value
+
+
+def trimmed(cells):
+    '''Sheets leaves the trailing blank cells of a row or column out'''
+    cells = list(cells)
+    while cells and cells[-1] == '':
+        cells.pop()
+    return cells
+
+
+def payload(header, rows):
+    return [list(header)] + [trimmed(formatted(value) for value in row) for row in rows]
+
+
+def typed_payload(range_data, header, rows):
+    '''Unformatted columns of the schema columns, as fetch_typed returns them'''
+    return {column: trimmed([column] + [unformatted(row[j]) for row in rows])
+            for j, column in enumerate(header) if column in config.SCHEMAS.get(range_data, {})}
+
+
+def legacy_table(values, tolerance=0.7):
+    '''load_data's table builder before the vectorized pass'''
+    values = [list(row) for row in values]
+    data = {}
+    table_len = len(values[0])
+    for j, column in enumerate(values[0]):
+        column_list = []
+        for i, row in enumerate(values):
+            if i == 0:
+                continue
+            if len(row) != table_len:
+                while len(row) != table_len + 1:
+                    row.append("")
+
+            if not row.count("") > tolerance*table_len:
+                column_list.append(row[j])
+
+        data[column] = column_list
+        df = pd.DataFrame(data=data)
+
+    return df
+
+
+def legacy_hist(data):
+    '''hist_handler'''
+    df_hist = data
+    df_hist['DATA TRABALHO'] = pd.to_datetime(df_hist['DATA TRABALHO'],
+                                              errors='coerce',
+                                              dayfirst=True)
+    df_hist['DATA ABERTURA OS'] = pd.to_datetime(df_hist['DATA ABERTURA OS'],
+                                                 errors='coerce',
+                                                 dayfirst=True)
+    df_hist['DURAÇÃO IDA'] = pd.to_timedelta(df_hist['DURAÇÃO IDA'])
+    df_hist['DURAÇÃO TRABALHO'] = pd.to_timedelta(
+        df_hist['DURAÇÃO TRABALHO'])
+    df_hist['DURAÇÃO VOLTA'] = pd.to_timedelta(df_hist['DURAÇÃO VOLTA'])
+
+    return df_hist
+
+
+def legacy_ultimo_g4_equip(ativos, historico_data, sorted_column):
+    columns = historico_data.columns.values
+    historico_grouped = historico_data.set_index('Nº de Série')
+
+    equipamentos = historico_grouped.index.values
+    equipamentos = list(set(list(equipamentos)))
+
+    result = pd.DataFrame(columns=columns)
+
+    for equip in ativos:
+        if equip in equipamentos:
+            df_aux = historico_grouped.loc[[equip]]
+            df_aux = df_aux.loc[df_aux['STATUS DO EQUIPAMENTO'] != ""]
+            df_aux = df_aux.sort_values(by=sorted_column)
+            df_aux = df_aux.tail(1)
+
+            result = pd.concat([result, df_aux])
+        else:
+            continue
+
+    return result
+
+
+def legacy_cronograma(df_equip, mes, ano):
+
+    def func(row, date_input):
+        if date_input > row['data_aux']:
+            if int(row['pmes_aux']) % 2 == 0:
+                x = True if mes % int(row['pfreq_aux']) == 0 else False
+            else:
+                x = True if (mes + 1) % int(row['pfreq_aux']) == 0 else False
+        else:
+            x = False
+        return x
+
+    df = df_equip.loc[df_equip['Status'] == 'ATIVO'].copy()
+
+    input_date = f'{ano}-{mes}-01'
+    input_date = datetime.strptime(input_date, '%Y-%m-%d').date()
+
+    df['pmes_aux'] = df['Periodicidade'].apply(
+        lambda x: x[-1:] if len(x) == 2 else x[-2:])
+    df['pfreq_aux'] = df['Periodicidade'].apply(
+        lambda x: 1 if x[0] == "A" else (2 if x[0] == "B" else 3))
+    df['data_aux'] = df.apply(lambda x: date(
+        int(x['Inicio periodicidade']), int(x['pmes_aux']), 1), axis=1)
+    df['cronograma'] = df.apply(func, axis=1, args=(input_date,))
+
+    df = df[['Nº de Série', 'Periodicidade', 'Classe', 'Inicio periodicidade',
+             'LOCALIZAÇÃO', 'Máquina', 'Modelo', 'Cidade', 'cronograma']]
+    df = df.rename(columns={'Nº de Série': 'Série'})
+
+    return df
+
+
+def legacy_programacao(lista, historico, os_preventivas, mes, ano):
+
+    def link_g4(row):
+        try:
+            return 'http://g4.transpotech.com.br/transpotech/os/detalhar/' + str(row[0][:row[0].index('-')])
+        except IndexError:
+            return ""
+
+    def situacao(row):
+        if row['cronograma']:
+            if row['Realizado']:
+                return 'Realizado'
+            else:
+                return 'Não Realizado'
+        else:
+            return 'Não Fazer'
+
+    mes = config.MONTHS[mes.lower()]
+    ano = int(ano)
+    df = legacy_cronograma(lista(), mes, ano)
+    df_hist = legacy_hist(historico())
+
+    ativos = list(lista().loc[lambda d: d['Status'] == 'ATIVO', 'Nº de Série'])
+    df_horimetro = legacy_ultimo_g4_equip(ativos, legacy_hist(historico()), 'DATA TRABALHO').reset_index()
+    df_horimetro.rename(columns={'index': 'Série'}, inplace=True)
+    df_horimetro = df_horimetro[['Série', 'HORÍMETRO']]
+
+    start_date = pd.to_datetime(f'{ano}-{mes}-01')
+    end_date = pd.to_datetime(f'{ano}-{mes}-{calendar.monthrange(ano, mes)[1]} 23:59:00')
+
+    os_mes = os_preventivas()
+    os_mes['Data'] = pd.to_datetime(os_mes['Data'],
+                                    errors='coerce',
+                                    dayfirst=True)
+    os_mes = os_mes.loc[os_mes['Data'] == start_date]
+    os_mes = os_mes[['Série', 'Nº OS']]
+
+    data = df.merge(os_mes, on='Série', how='left')
+
+    df_hist = df_hist.loc[(df_hist['TIPO DE MANUTENÇÃO'] == 'INSPEÇÃO PREVENTIVA') &
+                          (df_hist['DATA TRABALHO'] >= start_date) &
+                          (df_hist['DATA TRABALHO'] <= end_date)]
+
+    df1 = df_hist.loc[(df_hist['STATUS ATENDIMENTO'] == 'Validado') |
+                      (df_hist['STATUS ATENDIMENTO'] == 'Concluido') |
+                      (df_hist['STATUS ATENDIMENTO'] == 'Cancelado')]
+    df1 = df1[['Nº de Série', 'STATUS ATENDIMENTO', 'CÓDIGO OS APOLLO']]
+    df1 = df1.rename(columns={'STATUS ATENDIMENTO': 'atendimentos concluidos', 'Nº de Série': 'Série'})
+
+    df2 = df_hist[['Nº de Série', 'STATUS ATENDIMENTO', 'CÓDIGO OS APOLLO']]
+    df2 = df2.rename(columns={'STATUS ATENDIMENTO': 'atendimentos total', 'Nº de Série': 'Série'})
+
+    realizados = []
+    for row in data.iterrows():
+        serie = row[1]['Série']
+        os_row = row[1]['Nº OS']
+        concluidos_df = df1.loc[df1['Série'] == serie]
+        atendimentos_df = df2.loc[df2['Série'] == serie]
+        concluidos = len(df1.loc[df1['Série'] == serie])
+        atendimentos = len(df2.loc[df2['Série'] == serie])
+
+        if atendimentos_df['CÓDIGO OS APOLLO'].nunique() > 1:
+            concluidos = len(concluidos_df.loc[concluidos_df['CÓDIGO OS APOLLO'] == os_row])
+            atendimentos = len(atendimentos_df.loc[atendimentos_df['CÓDIGO OS APOLLO'] == os_row])
+            if atendimentos == concluidos:
+                realizados.append(True)
+            else:
+                realizados.append(False)
+        else:
+            if atendimentos == 0:
+                realizados.append(False)
+            else:
+                if atendimentos == concluidos:
+                    realizados.append(True)
+                else:
+                    realizados.append(False)
+
+    data['Realizado'] = realizados
+    data = data.merge(df_horimetro, on='Série', how='left')
+
+    os_g4 = []
+    status = []
+    for row in data.iterrows():
+        os_row = row[1]['Nº OS']
+        df_aux = df_hist.loc[df_hist['CÓDIGO OS APOLLO'] == os_row]
+        df_aux = df_aux[['CÓDIGO OS APOLLO', 'CÓDIGO OS G4', 'STATUS ATENDIMENTO']]
+
+        os_g4.append(list(df_aux['CÓDIGO OS G4']))
+        status.append(list(df_aux['STATUS ATENDIMENTO']))
+
+    data['OS G4'] = os_g4
+    data['STATUS G4'] = status
+    data['LINK'] = data['OS G4'].apply(link_g4)
+    data['SITUAÇÃO'] = data.apply(situacao, axis=1)
+
+    data = data.rename(columns={'Série': 'NÚMERO SÉRIE',
+                                'Máquina': 'FROTA',
+                                'Modelo': 'MODELO',
+                                'LOCALIZAÇÃO': 'CLIENTE',
+                                'Classe': 'CLASSE',
+                                'Cidade': 'CIDADE',
+                                'HORÍMETRO': 'HORÍMETRO ATUAL',
+                                'Nº OS': 'OS APOLLO',
+                                })
+
+    data = data[['NÚMERO SÉRIE', 'FROTA', 'MODELO', 'CLIENTE', 'CLASSE', 'CIDADE',
+                 'HORÍMETRO ATUAL', 'LINK', 'OS APOLLO', 'SITUAÇÃO', 'OS G4', 'STATUS G4']]
+
+    return data
+
+
+def legacy_historico():
+    return legacy_table(payload(HISTORICO_HEADER, HISTORICO_ROWS))
+
+
+def legacy_lista():
+    return legacy_table(payload(LISTA_HEADER, LISTA_ROWS))
+
+
+def legacy_os_preventivas():
+    return legacy_table(payload(OS_HEADER, OS_ROWS))
+
+
+def plain(df, numeric=()):
+    '''
+        Index, columns and cells as plain Python values, nulls as None, so
+        categoricals, typed columns and object columns compare by value.
+        The baseline kept the numeric columns as text, they are parsed first.
+    '''
+    df = df.copy()
+    for column in numeric:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+
+    df = df.astype(object)
+    df = df.where(df.notna(), None)
+    return {'index': list(df.index), 'columns': list(df.columns), 'data': df.values.tolist()}
+
+
+def parsed(range_data, header, rows):
+    values = payload(header, rows)
+    return config.parse_table(range_data, values, typed=typed_payload(range_data, header, rows))
+
+
+def ingested(range_data, header, rows):
+    values = payload(header, rows)
+    return config.ingest(range_data, values, typed=typed_payload(range_data, header, rows))
+
+
+@pytest.fixture(autouse=True)
+def sheets(monkeypatch):
+    '''The three tables loaded in a registry of their own, with no snapshots'''
+    registry = Registry()
+    registry.put(HISTORICO, ingested(HISTORICO, HISTORICO_HEADER, HISTORICO_ROWS), None)
+    registry.put(LISTA, ingested(LISTA, LISTA_HEADER, LISTA_ROWS), None)
+    registry.put(OS_PREVENTIVAS, ingested(OS_PREVENTIVAS, OS_HEADER, OS_ROWS), None)
+    monkeypatch.setattr(config, 'registry', registry)
+
+    st.cache_data.clear()
+    yield registry
+    st.cache_data.clear()
+
+
+def test_parse_table_matches_the_baseline_table_and_hist_handler():
+    new = parsed(HISTORICO, HISTORICO_HEADER, HISTORICO_ROWS)
+    old = legacy_hist(legacy_historico())
+
+    assert len(new) == len(HISTORICO_ROWS) - 1
+    assert plain(new) == plain(old, numeric=['HORÍMETRO'])
+
+
+def test_untyped_table_matches_the_baseline_table():
+    assert plain(parsed(LISTA, LISTA_HEADER, LISTA_ROWS)) == plain(legacy_lista())
+
+
+def test_dates_in_the_schema_match_to_datetime():
+    new = parsed(OS_PREVENTIVAS, OS_HEADER, OS_ROWS)
+    old = legacy_os_preventivas()
+    old['Data'] = pd.to_datetime(old['Data'], errors='coerce', dayfirst=True)
+
+    assert plain(new) == plain(old)
+
+
+@pytest.mark.parametrize('coluna', ['DATA TRABALHO', 'DATA ABERTURA OS'])
+def test_ultimo_g4_equip_matches_the_loop(coluna):
+    ativos = list(legacy_lista().loc[lambda d: d['Status'] == 'ATIVO', 'Nº de Série'])
+
+    new = config.ultimo_g4_equip(coluna)
+    old = legacy_ultimo_g4_equip(ativos, legacy_hist(legacy_historico()), coluna)
+
+    assert '2468' not in new.index
+    assert plain(new) == plain(old, numeric=['HORÍMETRO'])
+
+
+@pytest.mark.parametrize('mes, ano', [('Março', '2024'), ('janeiro', '2024'),
+                                      ('fevereiro', '2023'), ('junho', '2025')])
+def test_programacao_matches_the_loops(mes, ano):
+    new = config.programacao(mes, ano)
+    old = legacy_programacao(legacy_lista, legacy_historico, legacy_os_preventivas, mes, ano)
+
+    assert plain(new) == plain(old, numeric=['HORÍMETRO ATUAL'])
+
+
+@pytest.mark.parametrize('ano', [2022, 2023, 2024])
+def test_agenda_preventiva_matches_cronograma_for_every_month(ano):
+    df, agenda = config.agenda_preventiva()
+
+    for mes in range(1, 13):
+        old = legacy_cronograma(legacy_lista(), mes, ano)
+        assert agenda[pd.Timestamp(year=ano, month=mes, day=1)].tolist() == old['cronograma'].tolist()
+        assert plain(config.cronograma(mes, ano)) == plain(old)
+
+
+@pytest.mark.parametrize('inicio, fim', [
+    (datetime(2024, 3, 1), datetime(2024, 3, 31, 23, 59)),
+    (None, datetime(2024, 1, 31)),
+    (datetime(2024, 3, 9), None),
+    # Empty windows, between two dates and past the last one
+    (datetime(2023, 12, 1), datetime(2023, 12, 31)),
+    (datetime(2025, 1, 1), None),
+])
+def test_window_matches_a_date_mask(sheets, inicio, fim):
+    dataset = sheets.peek(HISTORICO)
+    df = dataset.frame
+    mask = df['DATA TRABALHO'].notna()
+    if inicio is not None:
+        mask &= df['DATA TRABALHO'] >= inicio
+    if fim is not None:
+        mask &= df['DATA TRABALHO'] <= fim
+
+    old = df.loc[mask]
+
+    assert plain(dataset.window('DATA TRABALHO', inicio, fim, sort=False)) == plain(old)
+    assert plain(dataset.window('DATA TRABALHO', inicio, fim)) == \
+        plain(old.sort_values('DATA TRABALHO', kind='stable'))
+
+
+@pytest.mark.parametrize('coluna, chaves', [
+    ('Nº de Série', ['001234', '3456']),
+    # Keys missing from the groups, nulls and repeated keys
+    ('Nº de Série', ['2468', None, '001234', '001234']),
+    ('CÓDIGO OS APOLLO', ['AP-2', 'AP-9']),
+    ('CÓDIGO OS APOLLO', []),
+])
+def test_lookup_matches_isin(sheets, coluna, chaves):
+    dataset = sheets.peek(HISTORICO)
+    df = dataset.frame
+
+    old = df.loc[df[coluna].isin([chave for chave in chaves if chave is not None])]
+
+    assert plain(dataset.lookup(coluna, chaves)) == plain(old)
+
+
+def sync(monkeypatch, rows, tail_rows, prefix_rows=None):
+    '''append_tail of the rows past the first len(rows), as load_data fetches them'''
+    monkeypatch.setattr(config, 'SAMPLE_ROWS', 4)
+    dataset = ingested(HISTORICO, HISTORICO_HEADER, rows)
+
+    values = payload(HISTORICO_HEADER, tail_rows)
+    prefix = payload(HISTORICO_HEADER, prefix_rows or tail_rows)[:config.SAMPLE_ROWS]
+    # Both reads start at the last ingested row, to catch edits to it
+    tail = values[len(rows):]
+    typed = {column: cells[len(rows):]
+             for column, cells in typed_payload(HISTORICO, HISTORICO_HEADER, tail_rows).items()}
+
+    return config.append_tail(HISTORICO, dataset, prefix, tail, typed=typed)
+
+
+def test_append_tail_matches_a_full_ingest(monkeypatch):
+    # The short last row leaves its typed columns shorter than the tail
+    synced = sync(monkeypatch, HISTORICO_ROWS[:6], HISTORICO_ROWS)
+    full = ingested(HISTORICO, HISTORICO_HEADER, HISTORICO_ROWS)
+
+    assert plain(synced.frame) == plain(full.frame)
+    assert synced.meta == full.meta
+    for column in config.CATEGORIES[HISTORICO]:
+        if column in full.frame.columns:
+            assert isinstance(synced.frame[column].dtype, pd.CategoricalDtype)
+
+
+def test_append_tail_without_new_rows_keeps_the_table(monkeypatch):
+    synced = sync(monkeypatch, HISTORICO_ROWS, HISTORICO_ROWS)
+    full = ingested(HISTORICO, HISTORICO_HEADER, HISTORICO_ROWS)
+
+    assert plain(synced.frame) == plain(full.frame)
+    assert synced.meta == full.meta
+
+
+def test_append_tail_with_a_mismatched_prefix_falls_back(monkeypatch):
+    edited = list(HISTORICO_ROWS)
+    edited[1] = edited[1][:10] + ('Cancelado',) + edited[1][11:]
+
+    assert sync(monkeypatch, HISTORICO_ROWS[:6], HISTORICO_ROWS, prefix_rows=edited) is None
@@ -0,0 +1,35 @@
+import pandas as pd
+
+import config
+
+RANGE = 'HISTORICO_DATA!A:Y'
+
+
+def test_typed_columns_replace_only_the_schema_cells():
+    # Formatted keys keep their display text, dates come from the serials
+    values = [['Nº de Série', 'DATA TRABALHO', 'HORÍMETRO'],
+              ['001.234', '01/02/2024 10:00:00', '1.234,5'],
+              ['5678', '', ''],
+              ['9012', '', '12.345,6']]
+    typed = {'DATA TRABALHO': ['DATA TRABALHO', 45323 + 10 / 24],
+             'HORÍMETRO': ['HORÍMETRO', 1234.5, '', 12345.6]}
+
+    df = config.parse_table(RANGE, values, typed=typed)
+
+    assert df['Nº de Série'].tolist() == ['001.234', '5678', '9012']
+    assert df['DATA TRABALHO'].tolist()[0] == pd.Timestamp('2024-02-01 10:00:00')
+    assert pd.isna(df['DATA TRABALHO'].tolist()[1])
+    assert df['HORÍMETRO'].tolist()[0] == 1234.5
+    assert pd.isna(df['HORÍMETRO'].tolist()[1])
+    # Shown as read, without the float32 rounding of 12345.599609375
+    assert df['HORÍMETRO'].tolist()[2] == 12345.6
+
+
+def test_typed_ranges_follow_the_rows_of_the_part():
+    header = ['CÓDIGO OS G4', 'Nº de Série', 'DATA TRABALHO', 'HORÍMETRO']
+
+    names, ranges = config.typed_ranges(RANGE, 'HISTORICO_DATA!A120:Y', header)
+
+    assert names == ['DATA TRABALHO', 'HORÍMETRO']
+    assert ranges == ['HISTORICO_DATA!C120:C', 'HISTORICO_DATA!D120:D']
+    assert config.typed_ranges('Lista de Equipamentos!A:AY', 'Lista de Equipamentos!A:AY', header) == ([], [])
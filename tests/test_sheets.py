@@ -0,0 +1,28 @@
+import pytest
+from google.oauth2.credentials import Credentials
+
+from sheets import SheetsClient
+
+
+def client():
+    return SheetsClient(Credentials(token='token'), pool_size=2)
+
+
+def test_pooled_connections_time_out():
+    with client().connection() as http:
+        assert http.http.timeout == 60
+
+
+def test_connection_of_a_failed_request_is_not_pooled():
+    sheets = client()
+
+    with pytest.raises(TimeoutError):
+        with sheets.connection() as http:
+            raise TimeoutError('timed out')
+    with sheets.connection() as other:
+        assert other is not http
+
+    with sheets.connection() as pooled:
+        pass
+    with sheets.connection() as again:
+        assert again is pooled
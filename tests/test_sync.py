@@ -0,0 +1,122 @@
+import pytest
+
+import config
+from datasets import Registry
+
+RANGE = 'TESTE!A:C'
+
+
+@pytest.fixture(autouse=True)
+def small_prefix(monkeypatch):
+    monkeypatch.setattr(config, 'SAMPLE_ROWS', 3)
+
+
+def sheet(rows):
+    return [['OS', 'Série', 'Técnico']] + [[f'{i}-1', f'S{i}', f'T{i % 3}'] for i in range(rows)]
+
+
+def tail(values, dataset):
+    '''Prefix and tail payloads as tail_ranges would fetch them from values'''
+    return values[:config.SAMPLE_ROWS], values[dataset.meta['rows'] - 1:]
+
+
+def test_appended_rows_match_a_full_ingest():
+    values = sheet(10)
+    dataset = config.ingest(RANGE, values[:7])
+
+    synced = config.append_tail(RANGE, dataset, *tail(values, dataset))
+
+    assert synced.frame.equals(config.ingest(RANGE, values).frame)
+    assert synced.meta['rows'] == len(values)
+
+
+def test_tail_without_new_rows_keeps_the_table():
+    values = sheet(10)
+    dataset = config.ingest(RANGE, values)
+
+    synced = config.append_tail(RANGE, dataset, *tail(values, dataset))
+
+    assert synced.frame.equals(dataset.frame)
+    assert synced.meta == dataset.meta
+
+
+def test_edit_in_the_prefix_rules_out_the_sync():
+    values = sheet(10)
+    dataset = config.ingest(RANGE, values)
+    values[1] = values[1][:2] + ['EDITADO']
+
+    assert config.append_tail(RANGE, dataset, *tail(values, dataset)) is None
+
+
+def test_edit_to_the_last_ingested_row_rules_out_the_sync():
+    values = sheet(10)
+    dataset = config.ingest(RANGE, values[:7])
+    values[6] = values[6][:2] + ['EDITADO']
+
+    assert config.append_tail(RANGE, dataset, *tail(values, dataset)) is None
+
+
+def test_edit_in_the_middle_is_not_detected():
+    # Rows between the prefix and the last ingested one are never compared,
+    # only a full reload picks their edits up
+    values = sheet(10)
+    dataset = config.ingest(RANGE, values[:8])
+    values[5] = values[5][:2] + ['EDITADO']
+
+    synced = config.append_tail(RANGE, dataset, *tail(values, dataset))
+
+    assert synced is not None
+    assert 'EDITADO' not in synced.frame['Técnico'].tolist()
+    assert 'EDITADO' in config.ingest(RANGE, values).frame['Técnico'].tolist()
+
+
+def test_rejected_tail_sync_reloads_the_range_whole(monkeypatch):
+    values = sheet(10)
+    registry = Registry()
+    registry.put(RANGE, config.ingest(RANGE, values[:7]), '1:antes')
+    registry.version = '1:antes'
+    values[6] = values[6][:2] + ['EDITADO']
+
+    prefix, last = config.tail_ranges(RANGE, registry.peek(RANGE))
+    sheets = {'LOG!A1:A': [['antes'], ['depois']], prefix: values[:config.SAMPLE_ROWS],
+              last: values[6:], RANGE: values}
+    fetched = []
+
+    def fetch_batch(ranges, max_attempts=5, **kwargs):
+        fetched.append(list(ranges))
+        return [sheets[r] for r in ranges]
+
+    monkeypatch.setattr(config, 'registry', registry)
+    monkeypatch.setattr(config, 'INCREMENTAL', {RANGE})
+    monkeypatch.setattr(config, 'fetch_batch', fetch_batch)
+    monkeypatch.setattr(config, '_version_state', {'row': 1, 'value': None, 'rounds': 0})
+
+    config.revalidate()
+
+    assert fetched == [['LOG!A1:A'], [prefix, last], [RANGE]]
+    assert registry.version == '2:depois'
+    assert config.ultima_atualizacao() == 'depois'
+    assert registry.peek(RANGE).frame.equals(config.ingest(RANGE, values).frame)
+
+
+def test_failed_token_refresh_still_revalidates(monkeypatch, capsys):
+    class Client:
+        def refresh_token(self):
+            raise OSError('token endpoint down')
+
+    rounds = []
+
+    def revalidate(full=False):
+        rounds.append(full)
+        raise ConnectionError('LOG unreachable')
+
+    monkeypatch.setattr(config, 'get_client', Client)
+    monkeypatch.setattr(config, 'revalidate', revalidate)
+    monkeypatch.setitem(config._version_state, 'rounds', 0)
+
+    config.keep_current()
+
+    assert rounds == [False]
+    out = capsys.readouterr().out
+    assert 'Token refresh failed: token endpoint down' in out
+    assert 'Revalidation failed: LOG unreachable' in out
@@ -0,0 +1,75 @@
+'''
+Widgets shared by the pages.
+
+st.tabs runs the body of every tab on each rerun, so abas() picks the
+view with a radio instead and the page only builds the one in sight.
+tabela_paginada() sends the browser one page of a table at a time, the
+rest of the rows never leave the server.
+
+Panels that depend on their own widgets only are wrapped in painel(), a
+fragment: a change to one of its widgets reruns that panel alone, not the
+whole page, and every run of it is timed at debug level on the ui
+logger, silent unless that level is turned on.
+'''
+import functools
+import logging
+import math
+import time
+
+import streamlit as st
+
+PAGE_ROWS = 50
+
+logger = logging.getLogger(__name__)
+
+
+def painel(func):
+    '''
+        Runs func as a fragment and logs how long each of its runs takes.
+        Its arguments are its declared inputs: a fragment rerun reuses the
+        ones it was last called with.
+    '''
+    @functools.wraps(func)
+    def medido(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            logger.debug('Painel %s: %.0f ms', func.__name__, (time.perf_counter() - inicio) * 1000)
+
+    return st.experimental_fragment(medido)
+
+
+def abas(rotulos, key):
+    '''Radio laid out as tabs, returns the label of the selected view'''
+    return st.radio(label='Visualização',
+                    options=rotulos,
+                    horizontal=True,
+                    label_visibility='collapsed',
+                    key=key)
+
+
+def tabela_paginada(df, key, linhas=PAGE_ROWS, **kwargs):
+    '''
+        Shows one page of df in a read-only data_editor, with a page picker
+        under it. kwargs go to st.data_editor.
+    '''
+    paginas = max(1, math.ceil(len(df) / linhas))
+
+    # The table may have shrunk since the page was picked
+    key = f'{key}_pagina'
+    if st.session_state.get(key, 1) > paginas:
+        st.session_state[key] = paginas
+
+    tabela = st.container()
+
+    c1, c2 = st.columns([5, 1])
+    with c2:
+        pagina = st.number_input('Página', min_value=1, max_value=paginas, step=1, key=key)
+    with c1:
+        inicio = (pagina - 1) * linhas
+        fim = min(inicio + linhas, len(df))
+        st.caption(f'Linhas {inicio + 1 if fim else 0}–{fim} de {len(df)}')
+
+    with tabela:
+        st.data_editor(df.iloc[inicio:fim], hide_index=True, disabled=True, **kwargs)